@@ -4,19 +4,21 @@ Utility functions for handling attachments in comments.
 Used by both pipeline.py and discover_stances.py
 """
 
+import asyncio
 import collections
+import hashlib
 import os
+from concurrent.futures import ProcessPoolExecutor
 import re
+import shutil
 import base64
-import mimetypes
 import logging
+import multiprocessing
+import aiohttp
 import requests
-from typing import Dict, Any, Tuple, Optional
-from dotenv import load_dotenv
-import litellm
-litellm.drop_params = True  # drop params a model does not support (e.g. temperature on GPT-5 reasoning models)
-
-load_dotenv()
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Any, Iterable, List, Tuple, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -62,6 +64,59 @@ def is_gibberish(text: str, min_chars: int = 10, max_control: float = 0.02,
     return False
 
 
+_VISION_MAX_BYTES = 5 * 1024 * 1024
+
+# The image formats the vision path accepts. A fixed table rather than
+# mimetypes.guess_type, which depends on the host's mime.types (some lack webp).
+_IMAGE_MIME_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+}
+
+
+def _vision_text(image_bytes: bytes, mime: str, label: str) -> str:
+    """Text a vision model reads from one image, or "" if none / on failure.
+
+    Takes bytes rather than a path so rasterised PDF pages can be sent straight
+    from memory. The chat API only accepts inline images as base64 data URLs,
+    so encoding once here is the one copy we can't avoid.
+    """
+    # Imported here, not at module level: litellm takes about a second to
+    # import, and every extraction worker process imports this module
+    # whether or not OCR is on.
+    import litellm
+    try:
+        b64 = base64.b64encode(image_bytes).decode("ascii")
+        resp = litellm.completion(
+            model="gpt-5.4-mini",
+            messages=[{"role": "user", "content": [
+                {"type": "text", "text": "Extract all text from this document. Return only the raw text content. If there is no readable text, return exactly the word EMPTY and nothing else."},
+                {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{b64}"}},
+            ]}],
+            temperature=0.0,
+            drop_params=True,  # GPT-5 models reject temperature
+        )
+        text = resp.choices[0].message.content or ""
+        text = text.strip()
+
+        # Check for the EMPTY sentinel we asked for (or empty response)
+        if not text or text.upper() == 'EMPTY':
+            logger.info(f"Vision extraction found no text in {label}")
+            return ""
+
+        if is_gibberish(text):
+            logger.warning(f"Vision extraction returned gibberish for {label}, discarding")
+            return ""
+        return text
+
+    except Exception as e:
+        logger.warning(f"Vision extraction failed for {label}: {e}")
+        return ""
+
+
 def extract_text_with_gemini(file_path: str) -> str:
     """Extract text from images using OpenAI vision via LiteLLM.
 
@@ -77,16 +132,13 @@ def extract_text_with_gemini(file_path: str) -> str:
 
     # Check file size (skip large files)
     file_size = os.path.getsize(file_path)
-    if file_size > 5 * 1024 * 1024:  # 5MB limit
+    if file_size > _VISION_MAX_BYTES:
         logger.warning(f"File too large for vision extraction: {file_path}")
         return ""
 
     # Determine MIME type; only images are supported by this path
-    mime, _ = mimetypes.guess_type(file_path)
-    image_mimes = {
-        "image/png", "image/jpeg", "image/gif", "image/webp",
-    }
-    if mime not in image_mimes:
+    mime = _IMAGE_MIME_TYPES.get(os.path.splitext(file_path)[1].lower())
+    if mime is None:
         logger.debug(
             f"Skipping vision extraction for non-image file {file_path} "
             f"(mime={mime}); PDFs/text handled by other extraction paths"
@@ -95,32 +147,11 @@ def extract_text_with_gemini(file_path: str) -> str:
 
     try:
         with open(file_path, "rb") as f:
-            b64 = base64.b64encode(f.read()).decode("utf-8")
-
-        resp = litellm.completion(
-            model="gpt-5.4-mini",
-            messages=[{"role": "user", "content": [
-                {"type": "text", "text": "Extract all text from this document. Return only the raw text content. If there is no readable text, return exactly the word EMPTY and nothing else."},
-                {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{b64}"}},
-            ]}],
-            temperature=0.0,
-        )
-        text = resp.choices[0].message.content or ""
-        text = text.strip()
-
-        # Check for the EMPTY sentinel we asked for (or empty response)
-        if not text or text.upper() == 'EMPTY':
-            logger.info(f"Vision extraction found no text in {file_path}")
-            return ""
-
-        if is_gibberish(text):
-            logger.warning(f"Vision extraction returned gibberish for {file_path}, discarding")
-            return ""
-        return text
-
-    except Exception as e:
+            image_bytes = f.read()
+    except OSError as e:
         logger.warning(f"Vision extraction failed for {file_path}: {e}")
         return ""
+    return _vision_text(image_bytes, mime, file_path)
 
 # Order to try the files of one logical attachment. regulations.gov stores the
 # submitter's original alongside a PDF rendition of the same document, so these
@@ -163,7 +194,64 @@ def group_attachments(entries: list) -> list:
     return [sorted(v, key=lambda uf: _rank(uf[1])) for v in groups.values()]
 
 
-def _pages_needing_ocr(doc, min_chars: int = 100) -> list:
+def _attachment_entries(attachment_field: str) -> list:
+    """(url, local filename) for each URL in a comment's attachment column."""
+    entries = []
+    for i, url in enumerate(attachment_field.split(',')):
+        url = url.strip()
+        if not url:
+            continue
+        filename = f"attachment_{i+1}_{url.split('/')[-1]}"
+        if '.' not in filename:
+            filename += '.pdf'  # Default extension
+        entries.append((url, filename))
+    return entries
+
+
+def _attachment_dir_name(comment_data: Dict[str, Any]) -> str:
+    """Name of the directory a comment's attachments are stored under."""
+    return (comment_data.get('Document ID') or
+            comment_data.get('Comment ID') or
+            'unknown_comment')
+
+
+# Extracted text is also cached by what a file contains, not just where it was
+# saved: the same letter uploaded under many comments (a campaign, or one
+# organisation's filing attached by each signatory) is extracted once. Lives
+# under attachments/ as `.extracted.txt` files so sync_state ships it too.
+CONTENT_CACHE_DIRNAME = '_by_content'
+_FINGERPRINT_CHUNK = 1024 * 1024
+
+
+def _content_fingerprint(file_path: str) -> str:
+    """Hash of a file's full contents.
+
+    The whole file, not a sample: two filings of the same size that differ only
+    in the middle must not share text. One streamed read is small next to
+    extracting the file.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_FINGERPRINT_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _content_cache_path(attachments_dir: str, fingerprint: str) -> str:
+    return os.path.join(attachments_dir, CONTENT_CACHE_DIRNAME, f"{fingerprint}.extracted.txt")
+
+
+def _read_cached_text(cache_path: str) -> Optional[str]:
+    """Cached extraction at `cache_path`, or None if absent or empty."""
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    except FileNotFoundError:
+        return None
+    return text if text.strip() else None
+
+
+def _pages_needing_ocr(doc, min_chars: int = 100, page_texts: Optional[List[str]] = None) -> list:
     """Page indexes with visible content but no usable text, so only OCR can read them.
 
     Three real cases reach this, and an image test alone catches only the first:
@@ -174,10 +262,13 @@ def _pages_needing_ocr(doc, min_chars: int = 100) -> list:
     So the test is "has ink but no readable text", not "has a big image". Pages
     that are genuinely blank have no ink and are skipped, since OCR would only
     spend a call to confirm they are empty.
+
+    Pass `page_texts` when the pages have already been read; text extraction is
+    the expensive part of this check.
     """
     out = []
     for i, page in enumerate(doc):
-        text = page.get_text().strip()
+        text = (page_texts[i] if page_texts is not None else page.get_text()).strip()
         if len(text) >= min_chars and not is_gibberish(text):
             continue
         if page.get_image_info() or page.get_drawings():
@@ -185,15 +276,53 @@ def _pages_needing_ocr(doc, min_chars: int = 100) -> list:
     return out
 
 
-def ocr_scanned_pdf(file_path: str, max_pages: int = 20) -> str:
-    """OCR the scan-like pages of a PDF by rasterising them and using the vision path.
+# A PDF at least this long is split across processes by page range. Below it,
+# starting the workers costs more than reading the pages.
+_PAGE_PARALLEL_MIN_PAGES = 64
+
+
+def _page_range_text(file_path: str, start: int, stop: int) -> List[str]:
+    """Text of pages [start, stop) of a PDF. Runs in a worker process."""
+    import fitz
+
+    with fitz.open(file_path) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+
+def _pdf_page_texts(doc, file_path: str) -> List[str]:
+    """Text of every page of an open PDF, in page order.
 
-    Capped at max_pages so one long scan can't run away with the budget.
+    A long filing is split into one contiguous page range per worker, each of
+    which reopens the file: PyMuPDF documents cannot be shared across threads
+    or processes, and a range per worker keeps the reopen cost to one per
+    process rather than one per page. Only done from the main process — inside
+    an extract_text_batch worker the file-level pool already has the cores.
     """
-    import tempfile
+    n = doc.page_count
+    if n < _PAGE_PARALLEL_MIN_PAGES or multiprocessing.parent_process() is not None:
+        return [page.get_text() for page in doc]
+    workers = min(os.cpu_count() or 1, 4)
+    step = -(-n // workers)
+    starts = list(range(0, n, step))
+    stops = [min(start + step, n) for start in starts]
+    with ProcessPoolExecutor(max_workers=len(starts)) as executor:
+        chunks = executor.map(_page_range_text, [file_path] * len(starts), starts, stops)
+        return [text for chunk in chunks for text in chunk]
+
+
+def ocr_scanned_pdf(file_path: str, max_pages: int = 20, pages: Optional[List[int]] = None) -> str:
+    """OCR the scan-like pages of a PDF by rasterising them and using the vision path.
 
+    Capped at max_pages so one long scan can't run away with the budget. `pages`
+    are the indexes to OCR when the caller has already found them; otherwise
+    they are worked out here.
+    """
     import fitz
 
+    if not os.getenv("OPENAI_API_KEY"):
+        logger.debug("OPENAI_API_KEY not found, skipping vision extraction")
+        return ""
+
     try:
         doc = fitz.open(file_path)
     except Exception as e:
@@ -201,7 +330,7 @@ def ocr_scanned_pdf(file_path: str, max_pages: int = 20) -> str:
         return ""
 
     with doc:
-        targets = _pages_needing_ocr(doc)
+        targets = pages if pages is not None else _pages_needing_ocr(doc)
         if not targets:
             return ""
         if len(targets) > max_pages:
@@ -213,47 +342,167 @@ def ocr_scanned_pdf(file_path: str, max_pages: int = 20) -> str:
         logger.info(f"  {os.path.basename(file_path)}: OCRing {len(targets)} scanned page(s)")
         chunks = []
         for i in targets:
-            tmp = None
             try:
                 # 200 dpi is enough for body text and keeps the PNG under the
-                # vision path's 5 MB ceiling.
-                pix = doc[i].get_pixmap(dpi=200)
-                with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as fh:
-                    tmp = fh.name
-                pix.save(tmp)
-                page_text = extract_text_with_gemini(tmp)
-                if page_text:
-                    chunks.append(page_text)
+                # vision path's 5 MB ceiling. Encoded in memory: nothing else
+                # needs the image, so a temp file would only add disk I/O.
+                png = doc[i].get_pixmap(dpi=200).tobytes("png")
             except Exception as e:
                 logger.warning(f"  OCR failed on page {i + 1} of {file_path}: {e}")
-            finally:
-                if tmp and os.path.exists(tmp):
-                    os.remove(tmp)
+                continue
+            if len(png) > _VISION_MAX_BYTES:
+                logger.warning(f"  Page {i + 1} of {file_path} too large for vision extraction")
+                continue
+            page_text = _vision_text(png, "image/png", f"page {i + 1} of {file_path}")
+            if page_text:
+                chunks.append(page_text)
 
     return '\n'.join(chunks)
 
 
+_DOWNLOAD_HEADERS = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'}
+# Attachments run to tens of MB; 256 KB reads keep that to a few hundred
+# Python-level writes instead of thousands.
+_DOWNLOAD_CHUNK_BYTES = 256 * 1024
+
+
+def _make_session() -> requests.Session:
+    """One session for every synchronous download.
+
+    Attachments almost all come from the same regulations.gov host, so reusing
+    pooled connections saves a TCP+TLS handshake on every file after the first.
+    Throttling (429) and transient server errors are retried with backoff,
+    honouring Retry-After, before a download is recorded as failed.
+    """
+    session = requests.Session()
+    session.headers.update(_DOWNLOAD_HEADERS)
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=frozenset({'GET'}))
+    adapter = HTTPAdapter(pool_connections=20, pool_maxsize=20, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_SESSION = _make_session()
+
+
+def _discard_partial(partial_path: str) -> None:
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+
+
 def download_attachment(attachment_url: str, output_path: str) -> bool:
-    """Download an attachment file."""
+    """Download an attachment file.
+
+    Bytes go to `<output_path>.part` and are renamed into place only once the
+    whole body has arrived. Every later run treats "the path exists" as "the
+    download finished", so a file cut off mid-stream must never appear there.
+    """
+    partial_path = f"{output_path}.part"
     try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'}
-        response = requests.get(attachment_url, stream=True, timeout=30, headers=headers)
+        response = _SESSION.get(attachment_url, stream=True, timeout=30)
         response.raise_for_status()
         
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        response.raw.decode_content = True  # undo any gzip transfer encoding
+        with open(partial_path, 'wb') as f:
+            shutil.copyfileobj(response.raw, f, length=_DOWNLOAD_CHUNK_BYTES)
+        os.replace(partial_path, output_path)
         return True
     except Exception as e:
         logger.error(f"Failed to download {attachment_url}: {e}")
+        _discard_partial(partial_path)
         return False
 
+
+async def _download_attachment_async(session: aiohttp.ClientSession, sem: asyncio.Semaphore,
+                                     attachment_url: str, output_path: str) -> bool:
+    """Async twin of download_attachment, for fetching many files at once."""
+    partial_path = f"{output_path}.part"
+    async with sem:
+        try:
+            async with session.get(attachment_url) as response:
+                response.raise_for_status()
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                with open(partial_path, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(_DOWNLOAD_CHUNK_BYTES):
+                        f.write(chunk)
+            os.replace(partial_path, output_path)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to download {attachment_url}: {e}")
+            _discard_partial(partial_path)
+            return False
+
+
+def _download_session(concurrency: int) -> aiohttp.ClientSession:
+    timeout = aiohttp.ClientTimeout(sock_connect=30, sock_read=30)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, headers=_DOWNLOAD_HEADERS)
+
+
+async def _download_many(targets: List[Tuple[str, str]], concurrency: int) -> List[bool]:
+    sem = asyncio.Semaphore(concurrency)
+    async with _download_session(concurrency) as session:
+        return await asyncio.gather(
+            *(_download_attachment_async(session, sem, url, path) for url, path in targets))
+
+
+def _uncached_preferred_files(rows: Iterable[Dict[str, Any]], attachments_dir: str,
+                              attachment_col: str) -> List[Tuple[str, str]]:
+    """(url, file_path) of each upload's preferred format that has no cached text yet.
+
+    The preferred format is the file process_attachments tries first, and so
+    the one worth fetching and extracting ahead of it.
+    """
+    files = []
+    for row in rows:
+        if not row.get(attachment_col):
+            continue
+        comment_dir = os.path.join(attachments_dir, _attachment_dir_name(row))
+        for group in group_attachments(_attachment_entries(row[attachment_col])):
+            url, filename = group[0]
+            file_path = os.path.join(comment_dir, filename)
+            cache_path = f"{file_path}.extracted.txt"
+            if os.path.exists(cache_path) and os.path.getsize(cache_path) > 0:
+                continue
+            files.append((url, file_path))
+    return files
+
+
+def prefetch_attachments(rows: Iterable[Dict[str, Any]], attachments_dir: str,
+                         attachment_col: str = 'Attachment Files',
+                         concurrency: int = 8) -> int:
+    """Download, concurrently, every file process_attachments is about to fetch.
+
+    process_attachments reads a comment's attachments one blocking request at a
+    time, so a first run over a docket spends most of its time waiting on
+    regulations.gov. This fetches the same files up front over one shared
+    connection pool, and process_attachments then finds them on disk.
+
+    Only the preferred format of each upload is fetched — the one
+    process_attachments tries first — and only when it has neither a cached
+    extraction nor a local copy. The other formats of an upload are usually never
+    needed, and when they are, process_attachments still downloads them itself.
+    Returns the number of files downloaded.
+    """
+    targets = [(url, path) for url, path in
+               _uncached_preferred_files(rows, attachments_dir, attachment_col)
+               if not os.path.exists(path)]
+    if not targets:
+        return 0
+    logger.info(f"Prefetching {len(targets)} attachment(s), {concurrency} at a time")
+    results = asyncio.run(_download_many(targets, concurrency))
+    fetched = sum(results)
+    if fetched < len(targets):
+        logger.warning(f"Prefetch: {len(targets) - fetched} download(s) failed; "
+                       f"they will be retried one at a time")
+    return fetched
+
+
 def extract_text_from_file(file_path: str, use_gemini: bool = False) -> str:
     """Extract text from various file types."""
-    import fitz  # PyMuPDF
-    import docx
-
     # Try Gemini first if enabled and available
     if use_gemini:
         gemini_text = extract_text_with_gemini(file_path)
@@ -265,10 +514,12 @@ def extract_text_from_file(file_path: str, use_gemini: bool = False) -> str:
         # PyMuPDF preserves visual reading order (position-aware blocks), unlike
         # PyPDF2 which follows raw content-stream order and garbles multi-column
         # layouts (e.g. two-column signature blocks come out one word per line).
+        import fitz  # PyMuPDF
         try:
             with fitz.open(file_path) as doc:
-                text = '\n'.join(page.get_text() for page in doc)
-                scanned = _pages_needing_ocr(doc)
+                page_texts = _pdf_page_texts(doc, file_path)
+                text = '\n'.join(page_texts)
+                scanned = _pages_needing_ocr(doc, page_texts=page_texts)
         except Exception as e:
             logger.error(f"Failed to extract text from PDF {file_path}: {e}")
             return ""
@@ -284,7 +535,7 @@ def extract_text_from_file(file_path: str, use_gemini: bool = False) -> str:
 
         # Pages with ink but no readable text need OCR, or they extract to nothing.
         if scanned:
-            ocr_text = ocr_scanned_pdf(file_path)
+            ocr_text = ocr_scanned_pdf(file_path, pages=scanned)
             if ocr_text:
                 text = f"{text}\n{ocr_text}".strip() if text.strip() else ocr_text
             else:
@@ -293,6 +544,7 @@ def extract_text_from_file(file_path: str, use_gemini: bool = False) -> str:
                     f"yielded no OCR text")
 
     elif file_path.lower().endswith(('.doc', '.docx')):
+        import docx
         try:
             doc = docx.Document(file_path)
             parts = [p.text for p in doc.paragraphs]
@@ -318,13 +570,15 @@ def extract_text_from_file(file_path: str, use_gemini: bool = False) -> str:
             return ""
 
     elif file_path.lower().endswith(('.html', '.htm')):
+        # lxml is already a dependency and parses in C; BeautifulSoup was never
+        # declared, so this branch used to fail on import and return nothing.
+        import lxml.html
         try:
-            from bs4 import BeautifulSoup
             with open(file_path, 'r', encoding='utf-8') as file:
-                soup = BeautifulSoup(file.read(), 'html.parser')
-                for script in soup(["script", "style"]):
-                    script.decompose()
-                text = soup.get_text()
+                tree = lxml.html.fromstring(file.read())
+            for element in tree.xpath('//script | //style'):
+                element.drop_tree()
+            text = tree.text_content()
         except Exception as e:
             logger.error(f"Failed to extract text from HTML {file_path}: {e}")
             return ""
@@ -340,9 +594,137 @@ def extract_text_from_file(file_path: str, use_gemini: bool = False) -> str:
     return text
 
 
+# Formats whose extraction is CPU-bound parsing, and so worth a worker process.
+# Images are absent on purpose: reading one is a vision call, which is network
+# wait rather than CPU, and a process pool would only add start-up cost.
+_PARALLEL_EXTRACT_EXTS = ('.pdf', '.docx', '.doc')
+
+
+def extract_text_batch(file_paths: List[str], use_gemini: bool = False,
+                       max_workers: Optional[int] = None) -> Dict[str, str]:
+    """Extract many files at once; returns {file_path: text}.
+
+    PDF and Word parsing holds the GIL, so files are spread over worker
+    processes rather than threads. Only the path crosses the process boundary,
+    and each file is independent of the others. Anything else is extracted
+    inline, where a worker would cost more than the work.
+    """
+    heavy = [p for p in file_paths if p.lower().endswith(_PARALLEL_EXTRACT_EXTS)]
+    light = [p for p in file_paths if not p.lower().endswith(_PARALLEL_EXTRACT_EXTS)]
+    results = {p: extract_text_from_file(p, use_gemini=use_gemini) for p in light}
+    if heavy:
+        max_workers = max_workers or min(os.cpu_count() or 1, 4)
+        logger.info(f"Extracting {len(heavy)} document(s) across {max_workers} processes")
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            texts = executor.map(extract_text_from_file, heavy,
+                                 [use_gemini] * len(heavy), chunksize=4)
+            results.update(zip(heavy, texts))
+    return results
+
+
+def preextract_attachments(rows: Iterable[Dict[str, Any]], attachments_dir: str,
+                           attachment_col: str = 'Attachment Files',
+                           use_gemini: bool = False,
+                           max_workers: Optional[int] = None) -> Dict[str, str]:
+    """Extract, in parallel, the files process_attachments would extract one by one.
+
+    Mirrors prefetch_attachments: for each upload it takes the preferred format
+    (the file process_attachments reads first), when that file is on disk and
+    has no cached extraction yet. Pass the result to process_attachments as
+    `pre_extracted`; it then skips straight to caching and bookkeeping.
+    """
+    by_fingerprint: Dict[str, List[str]] = {}
+    for _, file_path in _uncached_preferred_files(rows, attachments_dir, attachment_col):
+        if not (os.path.exists(file_path) and file_path.lower().endswith(_PARALLEL_EXTRACT_EXTS)):
+            continue
+        fingerprint = _content_fingerprint(file_path)
+        if _read_cached_text(_content_cache_path(attachments_dir, fingerprint)) is None:
+            by_fingerprint.setdefault(fingerprint, []).append(file_path)
+    if not by_fingerprint:
+        return {}
+    # Identical files are extracted once and the text handed to every copy.
+    extracted = extract_text_batch([paths[0] for paths in by_fingerprint.values()],
+                                   use_gemini=use_gemini, max_workers=max_workers)
+    return {path: extracted[paths[0]]
+            for paths in by_fingerprint.values() for path in paths}
+
+
+async def _fetch_and_extract(files: List[Tuple[str, str]], attachments_dir: str, use_gemini: bool,
+                             concurrency: int, executor: ProcessPoolExecutor) -> Dict[str, str]:
+    loop = asyncio.get_running_loop()
+    extractions: Dict[str, asyncio.Future] = {}
+    by_fingerprint: Dict[str, asyncio.Future] = {}
+
+    async def submit(file_path: str) -> None:
+        if not file_path.lower().endswith(_PARALLEL_EXTRACT_EXTS):
+            return
+        # Hashing reads the whole file; off the loop, so downloads keep moving.
+        fingerprint = await loop.run_in_executor(None, _content_fingerprint, file_path)
+        if _read_cached_text(_content_cache_path(attachments_dir, fingerprint)) is not None:
+            return
+        if fingerprint not in by_fingerprint:
+            by_fingerprint[fingerprint] = loop.run_in_executor(
+                executor, extract_text_from_file, file_path, use_gemini)
+        extractions[file_path] = by_fingerprint[fingerprint]
+
+    downloads = []
+    on_disk = []
+    for url, file_path in files:
+        if os.path.exists(file_path):
+            on_disk.append(asyncio.ensure_future(submit(file_path)))
+        else:
+            downloads.append((url, file_path))
+
+    if downloads:
+        logger.info(f"Fetching {len(downloads)} attachment(s), {concurrency} at a time, "
+                    f"extracting each as it lands")
+        sem = asyncio.Semaphore(concurrency)
+
+        async def fetch(url: str, file_path: str) -> bool:
+            if not await _download_attachment_async(session, sem, url, file_path):
+                return False
+            await submit(file_path)
+            return True
+
+        async with _download_session(concurrency) as session:
+            fetched = await asyncio.gather(*(fetch(url, path) for url, path in downloads))
+        if sum(fetched) < len(downloads):
+            logger.warning(f"Prefetch: {len(downloads) - sum(fetched)} download(s) failed; "
+                           f"they will be retried one at a time")
+
+    await asyncio.gather(*on_disk)
+    if not extractions:
+        return {}
+    texts = await asyncio.gather(*extractions.values())
+    return dict(zip(extractions, texts))
+
+
+def fetch_and_extract_attachments(rows: Iterable[Dict[str, Any]], attachments_dir: str,
+                                  attachment_col: str = 'Attachment Files',
+                                  use_gemini: bool = False,
+                                  concurrency: int = 8,
+                                  max_workers: Optional[int] = None) -> Dict[str, str]:
+    """prefetch_attachments and preextract_attachments as one overlapped stage.
+
+    Run back to back, the process pool sits idle for the whole download and the
+    network for the whole extraction. Here each PDF or Word file goes to the
+    pool the moment it lands, so parsing the first files overlaps fetching the
+    rest. Files already on disk are queued alongside the downloads, and content
+    hashing runs in a thread so it never stalls them. Returns {file_path: text}
+    for process_attachments' `pre_extracted`.
+    """
+    files = _uncached_preferred_files(rows, attachments_dir, attachment_col)
+    if not files:
+        return {}
+    max_workers = max_workers or min(os.cpu_count() or 1, 4)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return asyncio.run(_fetch_and_extract(files, attachments_dir, use_gemini, concurrency, executor))
+
+
 def reextract_attachment_text(comment_id: str, attachments_dir: str = 'attachments') -> Optional[str]:
     """Re-run extraction on a comment's already-downloaded PDF attachment(s),
-    refresh the on-disk `.extracted.txt` cache, and return the combined text.
+    refresh the on-disk `.extracted.txt` caches (per file and by content), and
+    return the combined text.
 
     Used to pick up extractor improvements (e.g. the PyPDF2 -> PyMuPDF swap) for
     specific comments without re-downloading or re-processing the whole corpus.
@@ -367,6 +749,18 @@ def reextract_attachment_text(comment_id: str, attachments_dir: str = 'attachmen
                 f.write(text or "")
         except Exception as e:
             logger.warning(f"Failed to refresh text cache {text_cache_path}: {e}")
+        # The content cache is read before extraction, so a stale entry there
+        # would keep serving the old text to every comment with this file.
+        content_cache_path = _content_cache_path(attachments_dir, _content_fingerprint(pdf_path))
+        try:
+            if text and text.strip():
+                os.makedirs(os.path.dirname(content_cache_path), exist_ok=True)
+                with open(content_cache_path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+            elif os.path.exists(content_cache_path):
+                os.remove(content_cache_path)
+        except Exception as e:
+            logger.warning(f"Failed to refresh content cache {content_cache_path}: {e}")
         if text and text.strip():
             parts.append(text.strip())
 
@@ -376,7 +770,8 @@ def reextract_attachment_text(comment_id: str, attachments_dir: str = 'attachmen
 def process_attachments(comment_data: Dict[str, Any], attachments_dir: str,
                        attachment_col: str = 'Attachment Files',
                        download_missing: bool = True,
-                       use_gemini: bool = False) -> Tuple[str, Dict[str, Any]]:
+                       use_gemini: bool = False,
+                       pre_extracted: Optional[Dict[str, str]] = None) -> Tuple[str, Dict[str, Any]]:
     """
     Download and process attachments for a comment, return combined text and processing status.
     
@@ -386,6 +781,7 @@ def process_attachments(comment_data: Dict[str, Any], attachments_dir: str,
         attachment_col: Name of the column containing attachment URLs
         download_missing: Whether to download attachments that don't exist locally
         use_gemini: Whether to use Gemini API for text extraction (requires GEMINI_API_KEY)
+        pre_extracted: {file_path: text} already extracted by preextract_attachments
     
     Returns:
         Tuple of (combined_text, processing_status)
@@ -408,29 +804,25 @@ def process_attachments(comment_data: Dict[str, Any], attachments_dir: str,
     }
     
     # Create directory for this comment's attachments
-    comment_id = (comment_data.get('Document ID') or 
-                 comment_data.get('Comment ID') or 
-                 'unknown_comment')
+    comment_id = _attachment_dir_name(comment_data)
     comment_attachment_dir = os.path.join(attachments_dir, comment_id)
     
     # One upload is stored as several files (the submitter's original plus a PDF
     # rendition). Group them and read only the first that yields text, instead of
     # extracting every copy of the same document.
-    entries = []
-    for i, url in enumerate(attachment_urls):
-        url = url.strip()
-        if not url:
-            continue
-        filename = f"attachment_{i+1}_{url.split('/')[-1]}"
-        if '.' not in filename:
-            filename += '.pdf'  # Default extension
-        entries.append((url, filename))
+    entries = _attachment_entries(comment_data[attachment_col])
 
     groups = group_attachments(entries)
     processing_status["groups"] = len(groups)
     processing_status["skipped_duplicate"] = 0
     had_pdf = any(f.lower().endswith('.pdf') for _, f in entries)
 
+    # One directory listing instead of a stat per file and per cache file.
+    try:
+        existing = {entry.name for entry in os.scandir(comment_attachment_dir)}
+    except FileNotFoundError:
+        existing = set()
+
     for group in groups:
         got_text = False
         for url, filename in group:
@@ -447,7 +839,7 @@ def process_attachments(comment_data: Dict[str, Any], attachments_dir: str,
             # permanently pin scanned PDFs at no text, so a fix to the extractor
             # could never reach them. Falling through re-extracts, and a
             # successful extraction then caches real text.
-            if os.path.exists(text_cache_path):
+            if f"{filename}.extracted.txt" in existing:
                 try:
                     with open(text_cache_path, 'r', encoding='utf-8') as f:
                         text = f.read()
@@ -463,7 +855,7 @@ def process_attachments(comment_data: Dict[str, Any], attachments_dir: str,
                     logger.warning(f"  Failed to load cached text: {e}")
 
             # Check if attachment file already exists
-            if os.path.exists(file_path):
+            if filename in existing:
                 logger.info(f"  Attachment {filename} already exists, skipping download")
             else:
                 if not download_missing:
@@ -483,13 +875,27 @@ def process_attachments(comment_data: Dict[str, Any], attachments_dir: str,
             # An image is only reached when no richer format exists in the group,
             # so read it rather than skipping: that is the one case where the
             # picture IS the comment. Cheap, because it is rare.
-            is_image = os.path.splitext(filename)[1].lower() in {
-                '.png', '.jpg', '.jpeg', '.gif', '.webp'}
+            is_image = os.path.splitext(filename)[1].lower() in _IMAGE_MIME_TYPES
+
+            content_cache_path = _content_cache_path(attachments_dir, _content_fingerprint(file_path))
+            text = _read_cached_text(content_cache_path)
+            if text is not None:
+                logger.info(f"  Same content as a file already extracted, reusing its text ({filename})")
+            elif pre_extracted is not None and file_path in pre_extracted:
+                text = pre_extracted[file_path]
+            else:
+                logger.info(f"  Extracting text from {filename}...")
+                text = extract_text_from_file(file_path, use_gemini=use_gemini or is_image)
 
-            logger.info(f"  Extracting text from {filename}...")
-            text = extract_text_from_file(file_path, use_gemini=use_gemini or is_image)
+            if text and text.strip():
+                try:
+                    os.makedirs(os.path.dirname(content_cache_path), exist_ok=True)
+                    with open(content_cache_path, 'w', encoding='utf-8') as f:
+                        f.write(text)
+                except Exception as e:
+                    logger.warning(f"  Failed to save content cache: {e}")
 
-            os.makedirs(os.path.dirname(text_cache_path), exist_ok=True)
+            # No makedirs: the attachment itself is in this directory by now.
             try:
                 with open(text_cache_path, 'w', encoding='utf-8') as f:
                     f.write(text or "")
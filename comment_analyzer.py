@@ -7,19 +7,20 @@ The analysis configuration (stances, prompts) should be defined
 per regulation in a separate configuration.
 """
 
+import asyncio
 import os
 import json
 import threading
+import time
 import logging
-from enum import Enum
-from dotenv import load_dotenv
+import random
 import litellm
 litellm.drop_params = True  # drop params a model does not support (e.g. temperature on GPT-5 reasoning models)
 from pydantic import BaseModel, Field, create_model
-from typing import List, Optional, Dict, Any
-
-# Load environment variables
-load_dotenv()
+from pydantic_core import from_json
+from tenacity import AsyncRetrying, Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+from litellm.utils import type_to_response_format_param
+from typing import List, Literal, Optional, Dict, Any, Tuple
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -97,6 +98,73 @@ class CommentAnalysisResult(BaseModel):
     )
 
 
+# Fields an analysis must carry before it is accepted, whatever else the config adds.
+_REQUIRED_FIELDS = frozenset(('stances', 'key_quote', 'rationale'))
+
+
+# Failures worth another attempt: the provider was slow, busy or briefly
+# unreachable. Anything else (a rejected request, a response that fails
+# validation) would fail the same way again, so it surfaces at once and the
+# caller can fall back to another model instead of paying for repeats.
+_TRANSIENT_ERRORS = (
+    TimeoutError,
+    litellm.Timeout,
+    litellm.RateLimitError,
+    litellm.APIConnectionError,
+    litellm.InternalServerError,
+    litellm.ServiceUnavailableError,
+)
+
+# Full-jitter exponential backoff between attempts, so workers that failed
+# together don't all retry together. A rate limit gets a longer one: the
+# window it reports is usually a minute, and every worker is hitting it.
+_RETRY_WAIT = wait_random_exponential(multiplier=1, max=30)
+_RATE_LIMIT_WAIT = wait_random_exponential(multiplier=5, max=120)
+
+
+# Longest Retry-After we will honour; past this, guessing is no worse than waiting.
+_RETRY_AFTER_MAX = 120
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """The wait a 429/503 asked for in its Retry-After header, in seconds, if it gave one."""
+    response = getattr(error, 'response', None)
+    value = getattr(response, 'headers', {}).get('retry-after')
+    try:
+        return min(float(value), _RETRY_AFTER_MAX) if value is not None else None
+    except ValueError:  # the HTTP-date form; no provider we call sends it
+        return None
+
+
+def _backoff(retry_state) -> float:
+    """Seconds to wait before the next attempt, by what went wrong on the last one.
+
+    When the provider says how long to wait, wait that long (plus a second of
+    jitter so the workers it turned away don't all return at once).
+    """
+    error = retry_state.outcome.exception()
+    hint = _retry_after(error)
+    if hint is not None:
+        return hint + random.random()
+    if isinstance(error, litellm.RateLimitError):
+        return _RATE_LIMIT_WAIT(retry_state)
+    return _RETRY_WAIT(retry_state)
+
+
+def _is_transient(error: BaseException) -> bool:
+    return isinstance(error, _TRANSIENT_ERRORS) and not is_credentials_error(error)
+
+
+def _one_of(options: List[str]):
+    """A string type restricted to `options`, for the response schema.
+
+    A Literal, not an Enum: an Enum becomes a named `$defs` entry, which
+    LiteLLM sometimes also inlines where it is used, so an option list could
+    go out twice per request. A Literal is written once, in place.
+    """
+    return Literal[tuple(options)] if options else str
+
+
 def _build_result_model(stance_options: List[str], entity_types: List[str]):
     """Build a schema whose stances/entity_type are constrained to the config values.
 
@@ -106,14 +174,12 @@ def _build_result_model(stance_options: List[str], entity_types: List[str]):
     """
     if not stance_options or not entity_types:
         return CommentAnalysisResult
-    StanceEnum = Enum("StanceEnum", {f"S{i}": v for i, v in enumerate(stance_options)}, type=str)
-    EntityEnum = Enum("EntityEnum", {f"E{i}": v for i, v in enumerate(entity_types)}, type=str)
     return create_model(
         "ConstrainedCommentAnalysisResult",
         __base__=CommentAnalysisResult,
-        stances=(List[StanceEnum], Field(default_factory=list,
+        stances=(List[_one_of(stance_options)], Field(default_factory=list,
             description="All stances/concerns expressed in the comment; select 0 or more from the allowed values (an exact match required).")),
-        entity_type=(EntityEnum, Field(
+        entity_type=(_one_of(entity_types), Field(
             description="Type of entity submitting the comment; must be exactly one of the allowed values.")),
     )
 
@@ -152,8 +218,8 @@ def _parse_fields(raw: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
 
 
 # Pydantic type per declared field type.
-#   multi_enum   -> List[Enum(options)]   (0..N)
-#   single_enum  -> Enum(options)          (exactly 1, required)
+#   multi_enum   -> List[Literal[options]] (0..N)
+#   single_enum  -> Literal[options]       (exactly 1, required)
 #   enum_or_empty-> str constrained to options-or-"" (kept as free str; validated downstream)
 #   text/quote/short_text -> str
 def _build_result_model_from_fields(fields: List[Dict[str, Any]], stance_options: List[str], entity_types: List[str]):
@@ -171,16 +237,32 @@ def _build_result_model_from_fields(fields: List[Dict[str, Any]], stance_options
         opts = _resolve_field_options(f, stance_options, entity_types)
         desc = (f.get('prompt') or f.get('label') or name).strip()
         if ftype == 'multi_enum':
-            E = Enum(f"Enum_{name}", {f"V{i}": v for i, v in enumerate(opts)}, type=str)
-            model_fields[name] = (List[E], Field(default_factory=list, description=desc))
+            model_fields[name] = (List[_one_of(opts)], Field(default_factory=list, description=desc))
         elif ftype == 'single_enum':
-            E = Enum(f"Enum_{name}", {f"V{i}": v for i, v in enumerate(opts)}, type=str)
-            model_fields[name] = (E, Field(description=desc))
+            model_fields[name] = (_one_of(opts), Field(description=desc))
         else:  # text, quote, short_text, enum_or_empty
             model_fields[name] = (str, Field(default="", description=desc))
     return create_model("ConfiguredCommentAnalysisResult", __base__=BaseModel, **model_fields)
 
 
+def _build_packed_model(result_model):
+    """Schema for several comments answered in one call.
+
+    Structured outputs need an object at the top level, so the list sits under
+    `results`. Each entry names the comment it answers before the analysis
+    itself, so the id is written first and answers can't drift onto a neighbour.
+    """
+    item = create_model(
+        "PackedCommentAnalysis",
+        comment_id=(str, Field(description="The comment_id of the comment this analysis is for")),
+        analysis=(result_model, ...),
+    )
+    return create_model(
+        "PackedCommentAnalysisResults",
+        results=(List[item], Field(description="One entry per comment given, each analyzed on its own")),
+    )
+
+
 def _build_prompt_from_fields(raw: Dict[str, Any], fields: List[Dict[str, Any]]) -> str:
     """Assemble the system prompt from each field's label + prompt (and enum options)."""
     stances = raw.get('stances', [])
@@ -216,10 +298,125 @@ def _build_prompt_from_fields(raw: Dict[str, Any], fields: List[Dict[str, Any]])
     return '\n'.join(parts)
 
 
+def _system_message(model: str, system_prompt: str) -> Dict[str, Any]:
+    """The system message, marked for prompt caching where the provider needs it.
+
+    The rubric is the same on every request and most of its tokens. OpenAI
+    caches a repeated prefix on its own; Anthropic only caches a block marked
+    with cache_control, so there the prompt goes out as a marked content block.
+    """
+    try:
+        provider = litellm.get_llm_provider(model)[1]
+    except Exception:
+        provider = None
+    if provider == 'anthropic':
+        return {"role": "system", "content": [
+            {"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]}
+    return {"role": "system", "content": system_prompt}
+
+
+def _message_content(message) -> str:
+    """The text of a chat completion message, or ValueError saying why there is none.
+
+    A refusal or a length-truncated reply comes back with no content; passing
+    that None to the JSON parser only produced an opaque TypeError.
+    """
+    content = getattr(message, 'content', None)
+    if isinstance(content, str) and content:
+        return content
+    refusal = getattr(message, 'refusal', None)
+    if refusal:
+        raise ValueError(f"Model refused: {refusal}")
+    raise ValueError("Model returned no content")
+
+
+# Normalized configs by (absolute path, mtime). The pipeline builds analyzers
+# per comment; this keeps that from re-reading the YAML and rebuilding the
+# prompt every time, while an edited file (new mtime) is still picked up.
+_CONFIG_CACHE: Dict[Tuple[str, int], Dict[str, Any]] = {}
+_CONFIG_CACHE_LOCK = threading.Lock()
+
+# Result model and response_format by the options that define them. Building
+# the Pydantic model and its JSON schema is the costly part of a new analyzer,
+# and the fallback path builds one per failed comment from the same config.
+_SCHEMA_CACHE: Dict[str, Tuple[type, Dict[str, Any]]] = {}
+
+
+def _result_schema(fields, stance_options: List[str], entity_types: List[str]):
+    """The (result model, response_format) for these options, built once per distinct set.
+
+    Shared across analyzers, so treat both as read-only.
+    """
+    key = json.dumps([fields, stance_options, entity_types], sort_keys=True)
+    with _CONFIG_CACHE_LOCK:
+        cached = _SCHEMA_CACHE.get(key)
+    if cached is not None:
+        return cached
+    # `fields:`-driven schema when the config declares one; else legacy schema.
+    if fields:
+        model = _build_result_model_from_fields(fields, stance_options, entity_types)
+    else:
+        model = _build_result_model(stance_options, entity_types)
+    # The JSON schema sent as response_format. Passing the Pydantic model makes
+    # LiteLLM rebuild this on every call; it never changes, so build it once.
+    schema = (model, type_to_response_format_param(model))
+    with _CONFIG_CACHE_LOCK:
+        return _SCHEMA_CACHE.setdefault(key, schema)
+
+
+# OpenAI's limits on one batch input file: 50,000 requests and 200 MB. The byte
+# cap is kept under the limit for the multipart upload's own overhead.
+BATCH_MAX_REQUESTS = 50_000
+BATCH_MAX_BYTES = 190 * 1024 * 1024
+
+
+def _batch_chunks(lines: List[str]) -> List[List[str]]:
+    """Split batch request lines into files OpenAI will accept, keeping their order."""
+    chunks, chunk, size = [], [], 0
+    for line in lines:
+        line_bytes = len(line.encode('utf-8')) + 1
+        if chunk and (len(chunk) >= BATCH_MAX_REQUESTS or size + line_bytes > BATCH_MAX_BYTES):
+            chunks.append(chunk)
+            chunk, size = [], 0
+        chunk.append(line)
+        size += line_bytes
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+# (model, prompt, schema) combinations whose size has been logged. The response
+# format is one shared object per schema (_SCHEMA_CACHE), so its id identifies it.
+_OVERHEAD_LOGGED = set()
+
+
+def _log_request_overhead(model: str, system_prompt: str, response_format: Dict[str, Any]) -> None:
+    """Log, once per model/prompt/schema, how many tokens every request carries.
+
+    Both go out with every request, so a config edit that grows them grows the
+    bill for every comment. Only informational: a tokenizer that cannot map
+    the model name must not stop the analyzer being built.
+    """
+    key = (model, system_prompt, id(response_format))
+    with _CONFIG_CACHE_LOCK:
+        if key in _OVERHEAD_LOGGED:
+            return
+        _OVERHEAD_LOGGED.add(key)
+    try:
+        prompt_tokens = litellm.token_counter(model=model, text=system_prompt)
+        schema_tokens = litellm.token_counter(model=model, text=json.dumps(response_format))
+    except Exception as e:
+        logger.debug(f"Could not count request overhead for {model}: {e}")
+        return
+    logger.info(f"Per-request overhead: system prompt {prompt_tokens:,} tokens, "
+                f"response schema {schema_tokens:,} tokens")
+
+
 class CommentAnalyzer:
     """OpenAI (via LiteLLM) analyzer for public comments using configurable prompts and categories."""
 
-    def __init__(self, model=None, timeout_seconds=120, config_file="analyzer_config.yaml"):
+    def __init__(self, model=None, timeout_seconds=120, config_file="analyzer_config.yaml", cache=None,
+                 config=None, max_output_tokens=None, deployments=None):
         """
         Initialize the analyzer with configuration from YAML (or JSON) file.
 
@@ -227,28 +424,54 @@ class CommentAnalyzer:
             model: LLM model to use (defaults to environment config)
             timeout_seconds: API timeout in seconds
             config_file: Path to YAML/JSON configuration file with regulation-specific settings
+            cache: Optional llm_cache.ResponseCache; identical requests are answered from it
+            config: An already-parsed analyzer_config.yaml dict; when given, config_file is not read
+            max_output_tokens: Cap on tokens generated per call (overrides the config's
+                `max_output_tokens`); None leaves it to the provider
+            deployments: LiteLLM Router model_list (overrides the config's `deployments`);
+                calls to `model` are then spread across every deployment named `model`.
+                The config's list is used only when it names `model`
         """
         self.model = model or os.getenv('LLM_MODEL', 'gpt-5.4-nano')
         self.timeout_seconds = timeout_seconds
+        self.cache = cache
+        self._packed_response_format = None  # built on first analyze_batch()
 
         # Load configuration from file
-        self.config = self._load_config(config_file)
+        if config is not None:
+            self.config = self._normalize_yaml_config(config)
+        else:
+            self.config = self._load_config(config_file)
+        self.max_output_tokens = max_output_tokens or self.config.get('max_output_tokens')
+        # Deployments passed in are meant for this model; ones from the config
+        # apply only to the model they name, so a fallback or short-comment
+        # analyzer built from the same config still calls its own model directly.
+        if deployments:
+            self.router = self._build_router(deployments)
+        else:
+            self.router = self._build_router(self.config.get('deployments'), required=False)
         self.stance_options = self.config.get('stance_options', [])
-        self.entity_types = self.config.get('entity_types', [])
+        # A copy: the loaded config is shared between analyzers (see _load_config).
+        self.entity_types = list(self.config.get('entity_types', []))
         # Always ensure Individual/Other is in the list as default
         if "Individual/Other" not in self.entity_types:
             self.entity_types.append("Individual/Other")
-        self.system_prompt = self.config.get('system_prompt')
-        # `fields:`-driven schema when the config declares one; else legacy schema.
+        # Lookups for validating responses; the lists keep prompt order. Stances
+        # are matched ignoring case and surrounding space, then written back in
+        # their configured spelling, so the report's counts never split in two.
+        self._entity_type_set = frozenset(self.entity_types)
+        self._stance_by_key = {s.strip().casefold(): s for s in self.stance_options}
+        # Sent with every request, so build it once rather than per call.
+        self.system_prompt = self.config.get('system_prompt') or self._default_system_prompt()
+        self._system_message = _system_message(self.model, self.system_prompt)
         self.fields = self.config.get('fields')
-        if self.fields:
-            self.result_model = _build_result_model_from_fields(self.fields, self.stance_options, self.entity_types)
-        else:
-            self.result_model = _build_result_model(self.stance_options, self.entity_types)
+        self.result_model, self.response_format = _result_schema(
+            self.fields, self.stance_options, self.entity_types)
 
         logger.info(f"Loaded configuration for: {self.config.get('regulation_name', 'Unknown Regulation')}")
         logger.info(f"Using {len(self.stance_options)} stance options")
         logger.info(f"Using {len(self.entity_types)} entity types")
+        _log_request_overhead(self.model, self.system_prompt, self.response_format)
 
         # Ensure API key is available
         api_key = os.getenv('OPENAI_API_KEY')
@@ -256,7 +479,11 @@ class CommentAnalyzer:
             raise ValueError("OPENAI_API_KEY not found in environment variables or .env file")
 
     def _load_config(self, config_file: str) -> Dict[str, Any]:
-        """Load configuration from YAML or JSON file."""
+        """Load configuration from YAML or JSON file.
+
+        The result is shared with every analyzer loading the same unchanged file,
+        so treat it as read-only.
+        """
         import yaml
 
         # Try YAML first, then JSON fallback
@@ -264,16 +491,31 @@ class CommentAnalyzer:
         json_file = config_file.replace('.yaml', '.json') if config_file.endswith('.yaml') else config_file
 
         try:
-            if os.path.exists(yaml_file):
-                with open(yaml_file, 'r', encoding='utf-8') as f:
-                    raw = yaml.safe_load(f)
-                return self._normalize_yaml_config(raw)
-            elif os.path.exists(json_file):
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+            # One stat per candidate: it both finds the file and dates it for the cache.
+            for path in dict.fromkeys((yaml_file, json_file)):
+                try:
+                    mtime = os.stat(path).st_mtime_ns
+                    break
+                except FileNotFoundError:
+                    continue
             else:
                 logger.warning(f"No config file found ({yaml_file} or {json_file}), using defaults")
                 return {}
+
+            cache_key = (os.path.abspath(path), mtime)
+            with _CONFIG_CACHE_LOCK:
+                cached = _CONFIG_CACHE.get(cache_key)
+            if cached is not None:
+                return cached
+
+            with open(path, 'r', encoding='utf-8') as f:
+                if path == yaml_file:
+                    config = self._normalize_yaml_config(yaml.safe_load(f))
+                else:
+                    config = json.load(f)
+            with _CONFIG_CACHE_LOCK:
+                _CONFIG_CACHE[cache_key] = config
+            return config
         except Exception as e:
             logger.error(f"Failed to load configuration: {e}")
             return {}
@@ -328,14 +570,16 @@ class CommentAnalyzer:
             'entity_types': entity_types,
             'system_prompt': system_prompt,
             'fields': fields,
+            'max_output_tokens': raw.get('max_output_tokens'),
+            'deployments': raw.get('deployments'),
         }
     
     def get_system_prompt(self):
         """Get the system prompt, using default if none provided"""
-        if self.system_prompt:
-            return self.system_prompt
-            
-        # Default generic prompt
+        return self.system_prompt
+
+    def _default_system_prompt(self):
+        """Generic prompt for configs that don't supply one."""
         stance_list = "\n".join([f"- {stance}" for stance in self.stance_options])
         entity_list = "\n".join([f"- {entity}" for entity in self.entity_types])
         
@@ -353,62 +597,169 @@ class CommentAnalyzer:
 
 Analyze objectively and avoid inserting personal opinions or biases."""
 
-    def analyze_with_timeout(self, comment_text, comment_id=None, organization=None, submitter=None):
-        """Analyze a comment with timeout protection"""
-        identifier = f" (ID: {comment_id})" if comment_id else ""
-
-        # Combine submitter info and comment text into one block
+    @staticmethod
+    def _comment_block(comment_text, organization=None, submitter=None):
+        """Submitter info and comment text combined into the block the model reads."""
         full_text_parts = []
         if submitter:
             full_text_parts.append(f"Submitter: {submitter}")
         if organization:
             full_text_parts.append(f"Organization: {organization}")
         full_text_parts.append(comment_text)
-        combined_text = "\n".join(full_text_parts)
+        return "\n".join(full_text_parts)
 
-        # Create a thread-safe container for the result
-        result_container = {'result': None, 'error': None}
+    def _build_router(self, deployments, required=True):
+        """A Router over several deployments of `self.model`, or None to call it directly.
 
-        def api_call():
-            try:
-                response = litellm.completion(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": self.get_system_prompt()},
-                        {"role": "user", "content": f"Analyze the following public comment{identifier}:\n\n{combined_text}"},
-                    ],
-                    response_format=self.result_model,
-                    temperature=0.0,
-                    timeout=self.timeout_seconds,
-                )
-
-                # Parse the JSON response
-                result_container['result'] = json.loads(response.choices[0].message.content)
+        One account's rate limit caps a single deployment; the Router spreads
+        calls across all of them (weighted by any rpm/tpm given) and cools down
+        one that keeps failing. Its own retries stay off for the same reason as
+        max_retries=0 below: analyze() already retries. When `self.model` is not
+        one of the deployment names, that is an error if `required`, and
+        otherwise means the deployments are for another model.
+        """
+        if not deployments:
+            return None
+        names = {d.get('model_name') for d in deployments}
+        if self.model not in names:
+            if not required:
+                return None
+            raise ValueError(f"Model {self.model!r} is not among the configured deployments "
+                             f"({', '.join(sorted(map(str, names)))})")
+        return litellm.Router(model_list=deployments, num_retries=0, timeout=self.timeout_seconds)
 
-            except Exception as e:
-                result_container['error'] = e
+    @property
+    def _llm(self):
+        """Where completion calls go: the Router when deployments are configured, else litellm."""
+        return self.router if self.router is not None else litellm
 
-        # Run API call in a thread
-        thread = threading.Thread(target=api_call)
-        thread.daemon = True
-        thread.start()
+    def _completion_kwargs(self, messages, response_format):
+        """Arguments shared by every live completion call."""
+        kwargs = dict(
+            model=self.model,
+            messages=messages,
+            response_format=response_format,
+            temperature=0.0,
+            timeout=self.timeout_seconds,
+            # analyze() retries failed comments itself; client retries on top of
+            # that turn one bad minute into several times the requests.
+            max_retries=0,
+        )
+        if self.max_output_tokens:
+            kwargs['max_tokens'] = self.max_output_tokens
+        return kwargs
 
-        # Wait for thread to complete with timeout
-        thread.join(timeout=self.timeout_seconds + 5)
+    def _build_messages(self, comment_text, comment_id=None, organization=None, submitter=None):
+        """The chat messages sent for one comment (the cache keys them without the ID)."""
+        identifier = f" (ID: {comment_id})" if comment_id else ""
+        combined_text = self._comment_block(comment_text, organization, submitter)
 
-        if thread.is_alive():
-            logger.error(f"API call timed out for comment{identifier}")
-            raise TimeoutError(f"Analysis timed out after {self.timeout_seconds + 5} seconds")
+        return [
+            self._system_message,
+            {"role": "user", "content": f"Analyze the following public comment{identifier}:\n\n{combined_text}"},
+        ]
 
-        # Check if there was an error
-        if result_container['error']:
-            raise result_container['error']
+    def analyze_with_timeout(self, comment_text, comment_id=None, organization=None, submitter=None):
+        """Analyze a comment, raising TimeoutError if the API takes longer than timeout_seconds"""
+        identifier = f" (ID: {comment_id})" if comment_id else ""
+        messages = self._build_messages(comment_text, comment_id, organization, submitter)
+
+        # LiteLLM enforces the timeout itself; a watchdog thread per call only
+        # added start-up cost and left the abandoned request running anyway.
+        try:
+            response = self._llm.completion(**self._completion_kwargs(messages, self.response_format))
+        except litellm.Timeout as e:
+            logger.error(f"API call timed out for comment{identifier}")
+            raise TimeoutError(f"Analysis timed out after {self.timeout_seconds} seconds") from e
 
-        return result_container['result']
+        # Parse the JSON response. pydantic-core's parser, not json.loads: it is
+        # the faster of the two, and validation stays in _check_result, which
+        # drops an invented stance rather than failing the whole comment.
+        return from_json(_message_content(response.choices[0].message))
     
+    def _check_result(self, result):
+        """Validate a parsed response and constrain it to the configured options."""
+        if not isinstance(result, dict):
+            raise ValueError("Result is not a dictionary")
+        
+        missing = _REQUIRED_FIELDS - result.keys()
+        if missing:
+            raise ValueError(f"Missing required field(s): {', '.join(sorted(missing))}")
+        
+        # Map stances onto the configured options (drop anything the model invented)
+        if 'stances' in result and isinstance(result['stances'], list):
+            matched = (self._stance_by_key.get(s.strip().casefold())
+                       for s in result['stances'] if isinstance(s, str))
+            result['stances'] = list(dict.fromkeys(s for s in matched if s is not None))
+
+        # Handle entity_type - keep as string since LLM returns string
+        if 'entity_type' in result:
+            # Ensure it's one of the allowed values
+            if result['entity_type'] not in self._entity_type_set:
+                result['entity_type'] = "Individual/Other"
+        
+        return result
+
+    def _request_key(self, messages, response_format):
+        """Cache key for a request with these messages and schema, or None without a cache."""
+        if self.cache is None:
+            return None
+        return self.cache.key(self.model, messages, response_format)
+
+    def _cache_key(self, comment_text, comment_id=None, organization=None, submitter=None):
+        """Cache key for analyzing one comment, or None when the analyzer has no cache.
+
+        Keyed on the request as it would be sent without the Document ID: the ID
+        labels the comment but does not change its analysis, and leaving it in
+        would give every copy of a form letter, and every comment whose dedup
+        representative changed between runs, a key of its own.
+        """
+        return self._request_key(
+            self._build_messages(comment_text, None, organization, submitter), self.response_format)
+
+    def _cached_result(self, cache_key, comment_id=None):
+        """A validated cached analysis for `cache_key`, or None."""
+        if cache_key is None:
+            return None
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return None
+        try:
+            return self._check_result(from_json(cached))
+        except ValueError:
+            logger.warning(f"Ignoring unusable cached analysis for comment"
+                           f"{f' (ID: {comment_id})' if comment_id else ''}")
+            return None
+
+    def _retrying(self, max_retries, comment_id=None, retrying_class=Retrying):
+        """Retry policy for one comment: transient errors only, with jittered backoff."""
+        label = f"comment{f' (ID: {comment_id})' if comment_id else ''}"
+
+        def log_retry(state):
+            logger.warning(f"Analysis attempt {state.attempt_number} failed for {label}: "
+                           f"{state.outcome.exception()}. Retrying...")
+
+        return retrying_class(
+            stop=stop_after_attempt(max_retries + 1),
+            wait=_backoff,
+            retry=retry_if_exception(_is_transient),
+            before_sleep=log_retry,
+            reraise=True,
+        )
+
+    @staticmethod
+    def _raise_if_credentials(error):
+        """Abort the run, not the comment, when the key itself is dead."""
+        if is_credentials_error(error):
+            # A dead key or an exhausted balance fails identically for
+            # every comment. Retrying, falling back to another model and
+            # recording a per-comment error would burn thousands of calls
+            # and write a parquet full of empty analyses. Abort instead.
+            raise LLMCredentialsError(str(error)) from error
+
     def analyze(self, comment_text, comment_id=None, organization=None, submitter=None, max_retries=3):
         """
-        Analyze a comment with retries for robustness.
+        Analyze a comment, retrying transient API failures with backoff.
         
         Args:
             comment_text: The text to analyze
@@ -418,57 +769,306 @@ Analyze objectively and avoid inserting personal opinions or biases."""
         Returns:
             Dictionary with analysis results
         """
-        last_error = None
-        
-        for attempt in range(max_retries + 1):
+        cache_key = self._cache_key(comment_text, comment_id, organization, submitter)
+        cached = self._cached_result(cache_key, comment_id)
+        if cached is not None:
+            return cached
+
+        try:
+            for attempt in self._retrying(max_retries, comment_id):
+                with attempt:
+                    try:
+                        response = self.analyze_with_timeout(comment_text, comment_id, organization, submitter)
+                    except Exception as e:
+                        self._raise_if_credentials(e)
+                        raise
+            result = self._check_result(response)
+        except LLMCredentialsError:
+            raise
+        except Exception as e:
+            logger.error(f"Analysis failed for comment{f' (ID: {comment_id})' if comment_id else ''}: {e}")
+            raise
+
+        if cache_key is not None:
+            self.cache.set(cache_key, json.dumps(result))
+        return result
+
+    def _build_packed_messages(self, items):
+        """Messages for several comments in one request.
+
+        Comments are numbered by position rather than by Document ID: the bulk
+        export repeats IDs across different comments, and a short number is
+        harder for the model to garble.
+        """
+        comments = [
+            {"comment_id": str(i),
+             "text": self._comment_block(item['comment_text'], item.get('organization'), item.get('submitter'))}
+            for i, item in enumerate(items, 1)
+        ]
+        return [
+            self._system_message,
+            {"role": "user", "content": (
+                "Analyze each of the following public comments on its own, as if it were the only "
+                "one. Return exactly one result per comment, tagged with its comment_id:\n\n"
+                + json.dumps(comments, ensure_ascii=False, indent=1))},
+        ]
+
+    def analyze_batch(self, items, batch_size=5):
+        """Analyze comments `batch_size` at a time, one LLM call per batch.
+
+        The system prompt is most of each request, so packing comments sends it
+        once per batch instead of once per comment.
+
+        Args:
+            items: dicts of analyze() keyword arguments (comment_text, comment_id,
+                organization, submitter)
+            batch_size: comments per call
+
+        Returns:
+            One entry per item, in order: the validated analysis, or None when the
+            call failed or its answer for that comment was missing or invalid.
+            Callers should send the None entries through analyze() on their own.
+        """
+        if self._packed_response_format is None:
+            self._packed_response_format = type_to_response_format_param(
+                _build_packed_model(self.result_model))
+        results = []
+        for start in range(0, len(items), batch_size):
+            results.extend(self._analyze_pack(items[start:start + batch_size]))
+        return results
+
+    def _analyze_pack(self, pack):
+        messages = self._build_packed_messages(pack)
+        cache_key = self._request_key(messages, self._packed_response_format)
+        content = self.cache.get(cache_key) if cache_key is not None else None
+        if content is None:
             try:
-                result = self.analyze_with_timeout(comment_text, comment_id, organization, submitter)
-                
-                # Validate the result has required fields
-                if not isinstance(result, dict):
-                    raise ValueError("Result is not a dictionary")
-                
-                required_fields = ['stances', 'key_quote', 'rationale']
-                for field in required_fields:
-                    if field not in result:
-                        raise ValueError(f"Missing required field: {field}")
-                
-                # Filter stances to only the configured stance options (drop anything the model invented)
-                if 'stances' in result and isinstance(result['stances'], list):
-                    result['stances'] = [s for s in result['stances'] if s in self.stance_options]
-
-                # Handle entity_type - keep as string since LLM returns string
-                if 'entity_type' in result:
-                    # Ensure it's one of the allowed values
-                    if result['entity_type'] not in self.entity_types:
-                        result['entity_type'] = "Individual/Other"
-                
-                return result
-                
-            except LLMCredentialsError:
-                raise
+                response = self._llm.completion(**self._completion_kwargs(messages, self._packed_response_format))
+                content = _message_content(response.choices[0].message)
+                entries = from_json(content).get('results', [])
             except Exception as e:
                 if is_credentials_error(e):
-                    # A dead key or an exhausted balance fails identically for
-                    # every comment. Retrying, falling back to another model and
-                    # recording a per-comment error would burn thousands of calls
-                    # and write a parquet full of empty analyses. Abort instead.
                     raise LLMCredentialsError(str(e)) from e
-                last_error = e
-                if attempt < max_retries:
-                    logger.warning(f"Analysis attempt {attempt + 1} failed for comment{f' (ID: {comment_id})' if comment_id else ''}: {e}. Retrying...")
-                    continue
-                else:
-                    logger.error(f"Analysis failed after {max_retries + 1} attempts for comment{f' (ID: {comment_id})' if comment_id else ''}: {e}")
-                    
-        # If we get here, all retries failed
-        raise last_error
+                logger.warning(f"Packed analysis of {len(pack)} comments failed: {e}")
+                return [None] * len(pack)
+            if cache_key is not None:
+                self.cache.set(cache_key, content)
+        else:
+            entries = from_json(content).get('results', [])
+
+        by_position = {}
+        for entry in entries:
+            try:
+                by_position[entry['comment_id']] = self._check_result(entry['analysis'])
+            except (KeyError, TypeError, ValueError):
+                continue
+        results = [by_position.get(str(i)) for i in range(1, len(pack) + 1)]
+        missing = results.count(None)
+        if missing:
+            logger.warning(f"Packed analysis returned nothing usable for {missing} of {len(pack)} comments")
+        return results
+
+    def analyze_via_batch_api(self, items, poll_interval=60, max_poll_interval=600):
+        """Analyze comments through OpenAI's Batch API instead of live calls.
+
+        Half the price and outside the per-minute rate limits, in exchange for up
+        to 24 hours' turnaround — for a first pass over a large docket, where
+        nobody is waiting on any one comment. Requests are the same messages and
+        schema as analyze(), so results share its cache both ways: cached
+        comments are not resubmitted, and batch results are cached for later runs.
+        A docket over OpenAI's per-batch limits goes out as several batches,
+        all submitted before any is waited on.
+
+        Args:
+            items: dicts of analyze() keyword arguments (comment_text, comment_id,
+                organization, submitter)
+            poll_interval: seconds before the first status check; doubles up to
+                max_poll_interval
+
+        Returns:
+            One entry per item, in order: the validated analysis, or None when
+            the batch returned nothing usable for it (analyze() those singly).
+        """
+        model, provider, _, _ = litellm.get_llm_provider(self.model)
+        if provider != 'openai':
+            raise ValueError(f"Batch API analysis supports OpenAI models only, not {self.model}")
+
+        results = [None] * len(items)
+        cache_keys = {}
+        lines = []
+        for i, item in enumerate(items):
+            messages = self._build_messages(**item)
+            cache_key = self._cache_key(**item)
+            results[i] = self._cached_result(cache_key, item.get('comment_id'))
+            if results[i] is not None:
+                continue
+            cache_keys[i] = cache_key
+            body = {"model": model, "messages": messages,
+                    "response_format": self.response_format, "temperature": 0.0}
+            if self.max_output_tokens:
+                body["max_completion_tokens"] = self.max_output_tokens
+            # Numbered by position, as in analyze_batch: Document IDs can repeat.
+            lines.append(json.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": body,
+            }, ensure_ascii=False))
+        if not lines:
+            return results
+
+        # Submit every batch before waiting on any, so they run side by side.
+        batches = [self._submit_batch(chunk) for chunk in _batch_chunks(lines)]
+        logger.info(f"Submitted {len(batches)} batch(es) for {len(lines)} comments "
+                    f"({len(items) - len(lines)} answered from cache)")
+        for batch in batches:
+            self._collect_batch(batch, results, cache_keys, poll_interval, max_poll_interval)
+
+        missing = sum(1 for i in cache_keys if results[i] is None)
+        if missing:
+            logger.warning(f"Batch API: no usable result for {missing} of {len(lines)} comments")
+        return results
+
+    def _submit_batch(self, lines):
+        """Upload one batch file of request lines and start the batch."""
+        try:
+            batch_file = litellm.create_file(
+                file=('comments.jsonl', ('\n'.join(lines) + '\n').encode('utf-8')),
+                purpose='batch', custom_llm_provider='openai')
+            batch = litellm.create_batch(
+                completion_window='24h', endpoint='/v1/chat/completions',
+                input_file_id=batch_file.id, custom_llm_provider='openai')
+        except Exception as e:
+            if is_credentials_error(e):
+                raise LLMCredentialsError(str(e)) from e
+            raise
+        logger.info(f"Submitted batch {batch.id}: {len(lines)} comments")
+        return batch
+
+    def _collect_batch(self, batch, results, cache_keys, poll_interval, max_poll_interval):
+        """Wait for one batch, then fill `results` (and the cache) by position."""
+        interval = poll_interval
+        while batch.status not in ('completed', 'failed', 'expired', 'cancelled'):
+            time.sleep(interval)
+            interval = min(interval * 2, max_poll_interval)
+            batch = litellm.retrieve_batch(batch_id=batch.id, custom_llm_provider='openai')
+            logger.info(f"Batch {batch.id}: {batch.status}")
+
+        # An expired batch still returns what it finished, so read any output.
+        if batch.status != 'completed':
+            logger.error(f"Batch {batch.id} ended {batch.status}")
+        if not batch.output_file_id:
+            return
+
+        output = litellm.file_content(file_id=batch.output_file_id, custom_llm_provider='openai')
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            position = int(record['custom_id'])
+            response = record.get('response') or {}
+            if response.get('status_code') != 200:
+                continue
+            try:
+                result = self._check_result(
+                    from_json(response['body']['choices'][0]['message']['content']))
+            except (KeyError, IndexError, TypeError, ValueError):
+                continue
+            results[position] = result
+            if cache_keys.get(position) is not None:
+                self.cache.set(cache_keys[position], json.dumps(result))
+
+    async def aanalyze_with_timeout(self, comment_text, comment_id=None, organization=None, submitter=None):
+        """Async analyze_with_timeout. The event loop enforces the timeout, so no thread per call."""
+        identifier = f" (ID: {comment_id})" if comment_id else ""
+        messages = self._build_messages(comment_text, comment_id, organization, submitter)
+        try:
+            response = await asyncio.wait_for(
+                self._llm.acompletion(**self._completion_kwargs(messages, self.response_format)),
+                timeout=self.timeout_seconds + 5,
+            )
+        except (asyncio.TimeoutError, litellm.Timeout) as e:
+            logger.error(f"API call timed out for comment{identifier}")
+            raise TimeoutError(f"Analysis timed out after {self.timeout_seconds} seconds") from e
+        return from_json(_message_content(response.choices[0].message))
+
+    async def aanalyze(self, comment_text, comment_id=None, organization=None, submitter=None, max_retries=3):
+        """Async analyze(): same cache, validation, retry policy and credentials abort."""
+        cache_key = self._cache_key(comment_text, comment_id, organization, submitter)
+        cached = self._cached_result(cache_key, comment_id)
+        if cached is not None:
+            return cached
+
+        try:
+            async for attempt in self._retrying(max_retries, comment_id, AsyncRetrying):
+                with attempt:
+                    try:
+                        response = await self.aanalyze_with_timeout(
+                            comment_text, comment_id, organization, submitter)
+                    except Exception as e:
+                        self._raise_if_credentials(e)
+                        raise
+            result = self._check_result(response)
+        except LLMCredentialsError:
+            raise
+        except Exception as e:
+            logger.error(f"Analysis failed for comment{f' (ID: {comment_id})' if comment_id else ''}: {e}")
+            raise
+
+        if cache_key is not None:
+            self.cache.set(cache_key, json.dumps(result))
+        return result
+
+    def analyze_many(self, items, concurrency=20):
+        """analyze_all() for synchronous callers: runs its own event loop.
+
+        Must not be called from inside a running loop; await analyze_all there.
+        """
+        return asyncio.run(self.analyze_all(items, concurrency))
+
+    async def analyze_all(self, items, concurrency=20):
+        """Analyze many comments concurrently from one event loop.
+
+        Args:
+            items: dicts of analyze() keyword arguments (comment_text, comment_id,
+                organization, submitter)
+            concurrency: most requests in flight at once; keep it under the
+                provider's rate limit
+
+        Returns:
+            One entry per item, in order: the analysis dict, or the exception
+            that comment failed with after its retries. LLMCredentialsError is
+            raised instead, since every other comment would fail the same way.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(item):
+            async with semaphore:
+                try:
+                    return await self.aanalyze(**item)
+                except LLMCredentialsError:
+                    raise
+                except Exception as e:
+                    return e
+
+        tasks = [asyncio.ensure_future(one(item)) for item in items]
+        try:
+            return await asyncio.gather(*tasks)
+        except LLMCredentialsError:
+            for task in tasks:
+                task.cancel()
+            raise
 
 # Create a regulation-specific analyzer
-def create_regulation_analyzer(model=None, timeout_seconds=None):
-    """Create an analyzer configured for regulation analysis using analyzer_config.yaml."""
+def create_regulation_analyzer(model=None, timeout_seconds=None, config=None):
+    """Create an analyzer configured for regulation analysis.
+
+    Reads analyzer_config.yaml from the current directory, or uses `config` (an
+    already-parsed analyzer_config.yaml dict) without touching the disk.
+    """
     return CommentAnalyzer(
         model=model,
         timeout_seconds=timeout_seconds or 120,
-        config_file='analyzer_config.yaml'
+        config_file='analyzer_config.yaml',
+        config=config,
     )
\ No newline at end of file
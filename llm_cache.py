@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of LLM responses, keyed by exactly what was sent.
+
+Iterating on a report means re-running the pipeline many times over the same
+comments with the same prompt. The text-keyed reuse in pipeline.py covers the
+common case, but it is dropped by --reprocess, by a fresh parquet, and by any
+run outside the pipeline. This cache sits under all of them: an identical
+(model, messages, schema) request returns the stored response instead of a
+new call, and anything that changes the request — an edited prompt, a new
+config field, another model — is simply a different key. The analyzer keys a
+comment's messages without its Document ID, so the same text under another ID
+is the same request.
+
+Recent entries are also held in memory (a bounded LRU in front of sqlite), so
+a form-letter campaign — thousands of copies of one request in a single run —
+costs one call and one disk write, then only dictionary lookups. Values stay
+JSON strings in both tiers; callers parse a fresh object per hit, so no two
+comments ever share a mutable result.
+
+Matching is exact on purpose. A near-match cache (embedding similarity) would
+hand "I support this rule" the answer cached for "I do not support this rule",
+and the stance IS the output. Stdlib sqlite3 rather than a cache package: one
+table, WAL so readers don't block the writer, and nothing new to install.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+DEFAULT_CACHE_FILE = '.llm_cache.sqlite'
+DEFAULT_MEMORY_ENTRIES = 10_000
+
+
+class ResponseCache:
+    """Response content by request hash, shared safely across worker threads."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_FILE, memory_entries: int = DEFAULT_MEMORY_ENTRIES):
+        self.path = path
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, content TEXT NOT NULL)')
+
+    @staticmethod
+    def key(model: str, messages: List[Dict[str, Any]], response_format: Optional[Dict[str, Any]] = None) -> str:
+        """Stable hash of a request. Anything that can change the answer belongs in it.
+
+        That includes the response schema: an option added to a `fields:` enum
+        changes what the model may answer even where the prompt text does not.
+        """
+        payload = json.dumps([model, messages, response_format], ensure_ascii=False, sort_keys=True)
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            content = self._memory.get(key)
+            if content is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return content
+            row = self._conn.execute(
+                'SELECT content FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._remember(key, row[0])
+            self.hits += 1
+        return row[0]
+
+    def set(self, key: str, content: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, content) VALUES (?, ?)', (key, content))
+            self._remember(key, content)
+
+    def _remember(self, key: str, content: str) -> None:
+        """Add to the in-memory tier, evicting the least recently used. Caller holds the lock."""
+        if self.memory_entries <= 0:
+            return
+        self._memory[key] = content
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def close(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._conn.close()
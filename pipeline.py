@@ -16,52 +16,68 @@ import csv
 import re
 import sys
 import logging
-import base64
 import time
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 
 # Import attachment utilities
-from attachment_utils import download_attachment, extract_text_from_file, process_attachments
+from attachment_utils import (download_attachment, extract_text_from_file,
+                              fetch_and_extract_attachments, process_attachments)
 import random
 from dotenv import load_dotenv
-import docx
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import pandas as pd
 from tqdm import tqdm
-import asyncio
-import aiohttp
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import threading
 
 # Load environment variables from the .env next to this script (robust to chdir)
 load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
 
 # Import the generic comment analyzer
 from comment_analyzer import CommentAnalyzer, LLMCredentialsError
+from llm_cache import ResponseCache
 
-# Simple logging setup
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('pipeline.log', mode='w'),
-    ],
-)
 logger = logging.getLogger(__name__)
 
+
+def setup_logging():
+    """Log to the console and to a fresh pipeline.log.
+
+    Called from main() rather than at import: attachment extraction runs in
+    worker processes, which re-import this module, and a module-level
+    FileHandler(mode='w') would truncate the run's log from every one of them.
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler(),
+            logging.FileHandler('pipeline.log', mode='w'),
+        ],
+    )
+
+
+# Parsed configs by (absolute path, mtime), so the several steps that read the
+# config in one run parse it once, while an edited file is still re-read.
+_YAML_CONFIG_CACHE: Dict[tuple, Dict[str, Any]] = {}
+
+
 def load_yaml_config():
-    """Load full analyzer config from analyzer_config.yaml (or .json fallback)."""
+    """Load full analyzer config from analyzer_config.yaml (or .json fallback).
+
+    The returned dict is shared between callers; treat it as read-only.
+    """
     import yaml
 
     for config_file, loader in [('analyzer_config.yaml', yaml.safe_load), ('analyzer_config.json', json.load)]:
         if os.path.exists(config_file):
             try:
+                cache_key = (os.path.abspath(config_file), os.stat(config_file).st_mtime_ns)
+                if cache_key in _YAML_CONFIG_CACHE:
+                    return _YAML_CONFIG_CACHE[cache_key]
                 with open(config_file, 'r') as f:
                     config = loader(f)
                     logger.info(f"Loaded config from {config_file}")
+                    _YAML_CONFIG_CACHE[cache_key] = config
                     return config
             except Exception as e:
                 logger.warning(f"Failed to load config from {config_file}: {e}")
@@ -139,7 +155,7 @@ def _stance_bucket(analysis: Any) -> str:
     return 'other'
 
 
-def read_comments_from_csv(csv_file: str, limit: Optional[int] = None, sample_size: Optional[int] = None, random_seed: int = 42, use_gemini: bool = False) -> List[Dict[str, Any]]:
+def read_comments_from_csv(csv_file: str, limit: Optional[int] = None, sample_size: Optional[int] = None, random_seed: int = 42, use_gemini: bool = False, download_workers: int = 8, extract_workers: Optional[int] = None) -> List[Dict[str, Any]]:
     """Read comments from CSV file and return as list of dicts."""
     logger.info(f"Reading comments from {csv_file}")
     
@@ -183,6 +199,17 @@ def read_comments_from_csv(csv_file: str, limit: Optional[int] = None, sample_si
     use_tracking_filter = bool(all_rows) and tn_present / len(all_rows) > 0.9
     non_comment_skipped = 0
 
+    # Fetch and extract the attachments the loop below will need up front —
+    # downloads concurrently, PDF/Word parsing across processes — rather than
+    # one at a time inside it.
+    attachment_col = column_mapping.get('attachment_files', 'Attachment Files')
+    candidate_rows = [r for r in all_rows
+                      if not use_tracking_filter or (r.get('Tracking Number', '') or '').strip()]
+    pre_extracted = fetch_and_extract_attachments(candidate_rows, attachments_dir, attachment_col,
+                                                  use_gemini=use_gemini,
+                                                  concurrency=download_workers,
+                                                  max_workers=extract_workers)
+
     # Second pass: process the selected comments with attachments
     logger.info("Processing comments and downloading attachments...")
     comments = []
@@ -206,7 +233,6 @@ def read_comments_from_csv(csv_file: str, limit: Optional[int] = None, sample_si
                        row.get('Comment', '')).strip()
 
         # Check for attachments using column mapping
-        attachment_col = column_mapping.get('attachment_files', 'Attachment Files')
         has_attachments = row.get(attachment_col, '').strip()
 
         # Skip empty comments without attachments
@@ -218,7 +244,8 @@ def read_comments_from_csv(csv_file: str, limit: Optional[int] = None, sample_si
         attachment_status = None
         if has_attachments:
             logger.info(f"Processing attachments for comment {comment_id}")
-            attachment_text, attachment_status = process_attachments(row, attachments_dir, attachment_col, use_gemini=use_gemini)
+            attachment_text, attachment_status = process_attachments(row, attachments_dir, attachment_col, use_gemini=use_gemini,
+                                                                      pre_extracted=pre_extracted)
         
         # Combine comment text and attachment text
         full_text = comment_text
@@ -299,6 +326,17 @@ def read_comments_from_csv(csv_file: str, limit: Optional[int] = None, sample_si
     logger.info(f"Loaded {len(comments)} comments")
     return comments
 
+
+def _dedup_key(text: str) -> str:
+    """Text identity for deduplication: case and whitespace ignored.
+
+    Campaign copies of one letter routinely differ only in line breaks or
+    spacing, and each distinct group costs an LLM call. Anything beyond that is
+    a different text; a near-match could turn "support" into "do not support".
+    """
+    return ' '.join(text.split()).lower()
+
+
 def create_dedup_table(comments: List[Dict[str, Any]]) -> tuple[List[Dict[str, Any]], Dict[str, List[Dict[str, Any]]]]:
     """Create deduplication table and return unique comments with mapping."""
     logger.info("Creating deduplication table...")
@@ -306,7 +344,7 @@ def create_dedup_table(comments: List[Dict[str, Any]]) -> tuple[List[Dict[str, A
     # Group by combined text content
     text_groups = {}
     for comment in comments:
-        text_key = comment['text'].strip().lower()
+        text_key = _dedup_key(comment['text'])
         if text_key not in text_groups:
             text_groups[text_key] = []
         text_groups[text_key].append(comment)
@@ -403,7 +441,7 @@ def merge_analysis_results(unique_analyzed_comments: List[Dict[str, Any]], dupli
     localized_count = 0
 
     for unique_comment in unique_analyzed_comments:
-        text_key = unique_comment['text'].strip().lower()
+        text_key = _dedup_key(unique_comment['text'])
 
         if text_key in duplicate_mapping:
             group = duplicate_mapping[text_key]
@@ -647,14 +685,30 @@ def check_batch_quality(analyzed_comments: List[Dict[str, Any]],
     return problems
 
 
+TRUNCATION_MARKER = '\n\n[... middle of comment omitted ...]\n\n'
+
+
+def _analysis_text(comment, truncate_chars=None):
+    """The comment text as sent to the LLM, cut to about truncate_chars.
+
+    A long letter states its position in the opening and again in the
+    conclusion, so an over-long text keeps its head and its tail and drops the
+    middle, rather than losing the ending entirely.
+    """
+    analysis_text = comment['text']
+    if truncate_chars and len(analysis_text) > truncate_chars:
+        head = truncate_chars // 2
+        tail = truncate_chars - head
+        analysis_text = analysis_text[:head] + TRUNCATION_MARKER + analysis_text[-tail:]
+    return analysis_text
+
+
 def analyze_single_comment(analyzer, comment, truncate_chars=None):
     """Analyze a single comment (for use in parallel processing).
 
     On failure, retries once with the stronger fallback model.
     """
-    analysis_text = comment['text']
-    if truncate_chars and len(analysis_text) > truncate_chars:
-        analysis_text = analysis_text[:truncate_chars]
+    analysis_text = _analysis_text(comment, truncate_chars)
 
     organization = comment.get('organization', '')
     submitter = comment.get('submitter', '')
@@ -677,7 +731,8 @@ def analyze_single_comment(analyzer, comment, truncate_chars=None):
 
     # One retry with stronger model
     try:
-        fallback = CommentAnalyzer(model=FALLBACK_MODEL, config_file='analyzer_config.yaml')
+        fallback = CommentAnalyzer(model=FALLBACK_MODEL, config_file='analyzer_config.yaml',
+                                   cache=analyzer.cache)
         analysis_result = fallback.analyze(analysis_text,
                                           comment_id=comment['id'],
                                           organization=organization,
@@ -693,14 +748,128 @@ def analyze_single_comment(analyzer, comment, truncate_chars=None):
         logger.error(f"Fallback model also failed for {comment['id']}: {e2}")
         return {**comment, 'analysis': None, 'analysis_error': str(e2), 'model_used': analyzer.model}
 
+
+def _analysis_items(comments, truncate_chars=None):
+    """analyze() keyword arguments for each comment, as the batch methods take them."""
+    return [{'comment_text': _analysis_text(c, truncate_chars),
+             'comment_id': c['id'],
+             'organization': c.get('organization', ''),
+             'submitter': c.get('submitter', '')}
+            for c in comments]
+
+
+def _answered(analyzer, comment, item, analysis):
+    """The pipeline result for a comment a batch method answered."""
+    analysis = validate_analysis(analysis, comment['text'],
+                                 submitter=item['submitter'], organization=item['organization'])
+    return {**comment, 'analysis': analysis, 'model_used': analyzer.model}
+
+
+def analyze_comment_pack(analyzer, comments, truncate_chars=None):
+    """Analyze several comments in one LLM call (see CommentAnalyzer.analyze_batch).
+
+    Any comment the packed call leaves unanswered goes through
+    analyze_single_comment, so it still gets retries and the fallback model.
+    Returns one result per comment, in order.
+    """
+    items = _analysis_items(comments, truncate_chars)
+    packed = analyzer.analyze_batch(items, batch_size=len(items))
+    return [_answered(analyzer, comment, item, analysis) if analysis is not None
+            else analyze_single_comment(analyzer, comment, truncate_chars)
+            for comment, item, analysis in zip(comments, items, packed)]
+
+
+def analyze_comments_batch_api(comments: List[Dict[str, Any]], model: str, truncate_chars: Optional[int] = None, cache: Optional[ResponseCache] = None, **parallel_kwargs) -> List[Dict[str, Any]]:
+    """Analyze comments through OpenAI's Batch API (see CommentAnalyzer.analyze_via_batch_api).
+
+    Half the price of live calls, but it blocks until the batch finishes (up to
+    24h), so it suits a first pass over a large docket. Comments the batch
+    returns nothing usable for are then analyzed live by
+    analyze_comments_parallel (parallel_kwargs go to it), with its retries,
+    fallback model and checkpointing. Returns results in input order.
+    """
+    analyzer = CommentAnalyzer(model=model, config_file='analyzer_config.yaml', cache=cache)
+    items = _analysis_items(comments, truncate_chars)
+    answers = analyzer.analyze_via_batch_api(items)
+
+    by_id = {}
+    unanswered = []
+    for comment, item, analysis in zip(comments, items, answers):
+        if analysis is None:
+            unanswered.append(comment)
+        else:
+            by_id[comment['id']] = _answered(analyzer, comment, item, analysis)
+    logger.info(f"Batch API answered {len(by_id)} of {len(comments)} comments")
+    if unanswered:
+        logger.info(f"Analyzing the remaining {len(unanswered)} live")
+        for result in analyze_comments_parallel(unanswered, model, truncate_chars, cache=cache, **parallel_kwargs):
+            by_id[result['id']] = result
+    return [by_id[comment['id']] for comment in comments]
+
+
+SHORT_COMMENT_MAX_CHARS = 1200  # default `short_comments.max_chars`
+PACK_MAX_CHARS = 40_000  # comment text per packed call, whatever --comments-per-call allows
+
+
+def build_analyzer_route(model: str, cache: Optional[ResponseCache] = None):
+    """The run's analyzers, as a function from analysis text to the analyzer to use.
+
+    With `short_comments: {model, max_chars}` in the config, comments whose
+    analysis text is at most max_chars go to that (cheaper) model: a one-line
+    "I oppose this rule" gets the same answer from a small model, and dockets
+    are mostly such comments. Without it every comment goes to `model`.
+    """
+    analyzer = CommentAnalyzer(model=model, config_file='analyzer_config.yaml', cache=cache)
+    short_cfg = (load_yaml_config() or {}).get('short_comments') or {}
+    if not short_cfg.get('model') or short_cfg['model'] == model:
+        return lambda text: analyzer
+    short_analyzer = CommentAnalyzer(model=short_cfg['model'], config_file='analyzer_config.yaml', cache=cache)
+    max_chars = short_cfg.get('max_chars', SHORT_COMMENT_MAX_CHARS)
+    logger.info(f"Comments of up to {max_chars} characters go to {short_analyzer.model}")
+    return lambda text: short_analyzer if len(text) <= max_chars else analyzer
+
+
+def _analysis_jobs(comments, route, truncate_chars=None, comments_per_call=1, pack_chars=PACK_MAX_CHARS):
+    """Split comments into (analyzer, comments) units of work, one LLM call each.
+
+    Comments are grouped by the analyzer `route` picks for them, so a pack never
+    mixes models; with comments_per_call == 1 every unit is a single comment.
+    Packs are filled shortest-first up to comments_per_call comments and
+    pack_chars characters, so similar lengths share a call: one long letter no
+    longer drags four one-liners into a slow, context-filling request.
+    """
+    groups = {}
+    for comment in comments:
+        text = _analysis_text(comment, truncate_chars)
+        analyzer = route(text)
+        groups.setdefault(id(analyzer), (analyzer, []))[1].append((len(text), comment))
+    if comments_per_call <= 1:
+        return [(analyzer, [comment]) for analyzer, group in groups.values() for _, comment in group]
+
+    jobs = []
+    for analyzer, group in groups.values():
+        pack, pack_len = [], 0
+        for length, comment in sorted(group, key=lambda entry: entry[0]):
+            if pack and (len(pack) == comments_per_call or pack_len + length > pack_chars):
+                jobs.append((analyzer, pack))
+                pack, pack_len = [], 0
+            pack.append(comment)
+            pack_len += length
+        if pack:
+            jobs.append((analyzer, pack))
+    return jobs
+
+
 CHECKPOINT_FILE = '.analysis_checkpoint.jsonl'
 
 
 def _checkpoint_key(comment: Dict[str, Any]) -> str:
     """Normalized comment text — the stable recovery key. Keying on text (not the
     dedup representative id) makes resume robust: the same comment content recovers
-    regardless of which duplicate happened to be chosen as representative this run."""
-    return (comment.get('text') or '').strip().lower()
+    regardless of which duplicate happened to be chosen as representative this run.
+    Same normalization as dedup, so a group whose representative is another
+    whitespace variant this run still finds its result."""
+    return _dedup_key(comment.get('text') or '')
 
 
 def _load_checkpoint() -> Dict[str, Dict[str, Any]]:
@@ -715,30 +884,34 @@ def _load_checkpoint() -> Dict[str, Dict[str, Any]]:
                     continue
                 key = entry.get('text_key')
                 if key:  # skip legacy id-only entries; the parquet snapshot covers those
-                    results[key] = entry
+                    # Re-normalized: entries from before whitespace-collapsing keys
+                    # were only stripped and lowercased.
+                    results[_dedup_key(key)] = entry
         logger.info(f"Loaded {len(results)} results from checkpoint (keyed by text)")
     return results
 
 
-def _append_checkpoint(results: List[Dict[str, Any]]):
-    """Append batch results to checkpoint file, keyed by normalized text."""
-    with open(CHECKPOINT_FILE, 'a') as f:
-        for r in results:
-            f.write(json.dumps({
-                'text_key': _checkpoint_key(r),
-                'id': r['id'],
-                'analysis': r.get('analysis'),
-                'analysis_error': r.get('analysis_error'),
-                # Persist which model produced this. Without it the value is lost
-                # on every checkpoint restore, the parquet ends up with no
-                # model_used column at all, and the report footer falls back to
-                # 'unknown' -- masked until now by runs passing --model by hand.
-                'model_used': r.get('model_used'),
-            }) + '\n')
-
-
-def analyze_comments_parallel(comments: List[Dict[str, Any]], model: str = "gemini-2.0-flash", truncate_chars: Optional[int] = None, max_workers: int = 8, batch_size: int = 50, output_file: Optional[str] = None, snapshot_every: int = 5) -> List[Dict[str, Any]]:
-    """Analyze comments using parallel processing for much faster LLM calls."""
+def _checkpoint_line(r: Dict[str, Any]) -> str:
+    """One checkpoint entry, keyed by normalized text."""
+    return json.dumps({
+        'text_key': _checkpoint_key(r),
+        'id': r['id'],
+        'analysis': r.get('analysis'),
+        'analysis_error': r.get('analysis_error'),
+        # Persist which model produced this. Without it the value is lost
+        # on every checkpoint restore, the parquet ends up with no
+        # model_used column at all, and the report footer falls back to
+        # 'unknown' -- masked until now by runs passing --model by hand.
+        'model_used': r.get('model_used'),
+    }) + '\n'
+
+
+def analyze_comments_parallel(comments: List[Dict[str, Any]], model: str = "gemini-2.0-flash", truncate_chars: Optional[int] = None, max_workers: int = 8, batch_size: int = 50, output_file: Optional[str] = None, snapshot_every: int = 5, cache: Optional[ResponseCache] = None, comments_per_call: int = 1) -> List[Dict[str, Any]]:
+    """Analyze comments using parallel processing for much faster LLM calls.
+
+    With comments_per_call > 1, each worker sends that many comments in one
+    request (analyze_comment_pack) instead of one request per comment.
+    """
     logger.info(f"Analyzing {len(comments)} comments with {model}")
     logger.info(f"Using {max_workers} parallel workers, batch size {batch_size}")
     if truncate_chars:
@@ -771,8 +944,15 @@ def analyze_comments_parallel(comments: List[Dict[str, Any]], model: str = "gemi
         logger.info("All comments already analyzed (from checkpoint)")
         return analyzed_comments
 
-    # Create overall progress bar
-    with tqdm(total=total_comments, desc="Analyzing comments", unit="comment") as overall_pbar:
+    # One analyzer for the whole run. It holds nothing per comment, so the
+    # workers can share it; building one per comment re-created the Pydantic
+    # schema and system prompt thousands of times.
+    route = build_analyzer_route(model, cache)
+
+    # Each result is checkpointed the moment it completes, not when its batch
+    # does: a crash or Ctrl-C loses only the calls still in flight.
+    with tqdm(total=total_comments, desc="Analyzing comments", unit="comment") as overall_pbar, \
+            open(CHECKPOINT_FILE, 'a', buffering=1) as checkpoint_out:
         # Process in batches to avoid overwhelming the API
         for batch_start in range(0, len(still_needed), batch_size):
             batch_end = min(batch_start + batch_size, len(still_needed))
@@ -780,17 +960,14 @@ def analyze_comments_parallel(comments: List[Dict[str, Any]], model: str = "gemi
 
             # Use ThreadPoolExecutor for parallel API calls
             with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # Create analyzer for each worker (thread-safe)
-                def create_analyzer():
-                    # Use analyzer_config.json from current directory
-                    return CommentAnalyzer(model=model, config_file='analyzer_config.yaml')
-
                 # Submit all comments in this batch
                 future_to_comment = {}
-                for comment in batch_comments:
-                    analyzer = create_analyzer()
-                    future = executor.submit(analyze_single_comment, analyzer, comment, truncate_chars)
-                    future_to_comment[future] = comment
+                for analyzer, pack in _analysis_jobs(batch_comments, route, truncate_chars, comments_per_call):
+                    if comments_per_call > 1:
+                        future = executor.submit(analyze_comment_pack, analyzer, pack, truncate_chars)
+                    else:
+                        future = executor.submit(analyze_single_comment, analyzer, pack[0], truncate_chars)
+                    future_to_comment[future] = pack
 
                 # Collect results as they complete
                 batch_results = []
@@ -798,13 +975,11 @@ def analyze_comments_parallel(comments: List[Dict[str, Any]], model: str = "gemi
                     try:
                         result = future.result()
                     except LLMCredentialsError as e:
-                        # Every remaining comment would fail the same way. Keep
-                        # what this batch already produced, checkpoint it, and
-                        # abort — this needs a human, not a retry.
+                        # Every remaining comment would fail the same way. What
+                        # this batch already produced is checkpointed; abort —
+                        # this needs a human, not a retry.
                         for f in future_to_comment:
                             f.cancel()
-                        if batch_results:
-                            _append_checkpoint(batch_results)
                         logger.error(
                             "LLM credentials rejected (key invalid or out of credit): %s", e)
                         logger.error(
@@ -812,17 +987,17 @@ def analyze_comments_parallel(comments: List[Dict[str, Any]], model: str = "gemi
                             "already analyzed is checkpointed and will be reused.",
                             len(analyzed_comments) + len(batch_results))
                         raise
-                    batch_results.append(result)
-                    overall_pbar.update(1)  # Update overall progress bar
+                    # A pack's future yields a list, a single comment's a dict.
+                    results = result if isinstance(result, list) else [result]
+                    checkpoint_out.writelines(_checkpoint_line(r) for r in results)
+                    batch_results.extend(results)
+                    overall_pbar.update(len(results))  # Update overall progress bar
 
                 # Maintain original order within batch
                 comment_id_to_result = {result['id']: result for result in batch_results}
                 ordered_results = [comment_id_to_result[comment['id']] for comment in batch_comments]
                 analyzed_comments.extend(ordered_results)
 
-                # Save checkpoint after each batch
-                _append_checkpoint(ordered_results)
-
                 # Log running progress and periodically write an inspectable parquet
                 # snapshot so results can be viewed / the report regenerated mid-run.
                 batch_num = batch_start // batch_size + 1
@@ -845,11 +1020,12 @@ def analyze_comments_parallel(comments: List[Dict[str, Any]], model: str = "gemi
     logger.info(f"Completed analysis of {len(analyzed_comments)} comments")
     return analyzed_comments
 
-def analyze_comments(comments: List[Dict[str, Any]], model: str = "gemini-2.0-flash", truncate_chars: Optional[int] = None, parallel: bool = True) -> List[Dict[str, Any]]:
+def analyze_comments(comments: List[Dict[str, Any]], model: str = "gemini-2.0-flash", truncate_chars: Optional[int] = None, parallel: bool = True, cache: Optional[ResponseCache] = None, comments_per_call: int = 1) -> List[Dict[str, Any]]:
     """Analyze comments using the LLM with optional parallel processing."""
     if parallel and len(comments) > 5:
         # Use parallel processing for better performance
-        return analyze_comments_parallel(comments, model, truncate_chars)
+        return analyze_comments_parallel(comments, model, truncate_chars, cache=cache,
+                                         comments_per_call=comments_per_call)
     else:
         # Fall back to sequential processing for small batches or if parallel is disabled
         logger.info(f"Analyzing {len(comments)} comments with {model} (sequential)")
@@ -857,16 +1033,22 @@ def analyze_comments(comments: List[Dict[str, Any]], model: str = "gemini-2.0-fl
             logger.info(f"Truncating text to {truncate_chars} characters for LLM analysis")
         
         # Initialize analyzer using configuration file from current directory
-        analyzer = CommentAnalyzer(model=model, config_file='analyzer_config.yaml')
-        
-        analyzed_comments = []
-        
+        route = build_analyzer_route(model, cache)
+
+        by_id = {}
+
         # Use tqdm for progress bar
-        for comment in tqdm(comments, desc="Analyzing comments", unit="comment"):
-            result = analyze_single_comment(analyzer, comment, truncate_chars)
-            analyzed_comments.append(result)
-        
-        return analyzed_comments
+        with tqdm(total=len(comments), desc="Analyzing comments", unit="comment") as pbar:
+            for analyzer, pack in _analysis_jobs(comments, route, truncate_chars, comments_per_call):
+                if comments_per_call > 1:
+                    results = analyze_comment_pack(analyzer, pack, truncate_chars)
+                else:
+                    results = [analyze_single_comment(analyzer, pack[0], truncate_chars)]
+                by_id.update((r['id'], r) for r in results)
+                pbar.update(len(pack))
+
+        # Routing groups comments by model; hand them back in input order.
+        return [by_id[comment['id']] for comment in comments]
 
 # Regulations.gov submitters often put a short stub in the comment body
 # ("See attached file(s)", "[DRAFT] ...") and the real letter in an attachment.
@@ -1201,6 +1383,11 @@ def get_db_connection():
         logger.warning("DATABASE_URL not found in environment")
         return None
     
+    # Imported here: only --to-database needs it, and every run (plus every
+    # extraction worker, which re-imports this module) would pay for it otherwise.
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+
     try:
         conn = psycopg2.connect(db_url, cursor_factory=RealDictCursor)
         return conn
@@ -1357,17 +1544,23 @@ def main():
     parser.add_argument('--output', type=str, default=None, help='Output Parquet file (default: full_run.parquet in the regulation dir)')
     parser.add_argument('--sample', type=int, help='Process only N random comments for testing')
     parser.add_argument('--model', type=str, default='gpt-5.4-nano', help='LLM model to use (LiteLLM model string, e.g. gpt-4o-mini)')
-    parser.add_argument('--truncate', type=int, default=50000, help='Truncate comment text to N characters before LLM analysis (default: 50000)')
+    parser.add_argument('--truncate', type=int, default=50000, help='Cut comment text to N characters before LLM analysis, keeping the start and end (default: 50000)')
     parser.add_argument('--to-database', action='store_true', help='Store results in PostgreSQL database (requires DATABASE_URL in .env)')
     parser.add_argument('--workers', type=int, default=8, help='Number of parallel workers for LLM calls (default: 8)')
     parser.add_argument('--batch-size', type=int, default=50, help='Batch size for parallel processing (default: 50)')
     parser.add_argument('--no-parallel', action='store_true', help='Disable parallel processing (use sequential)')
+    parser.add_argument('--download-workers', type=int, default=8, help='Number of attachment downloads to run at once (default: 8)')
+    parser.add_argument('--extract-workers', type=int, default=None, help='Number of processes for PDF/Word text extraction (default: min(CPUs, 4))')
+    parser.add_argument('--batch-api', action='store_true', help="Analyze through OpenAI's Batch API: half price, but waits up to 24h for results (OpenAI models only)")
+    parser.add_argument('--comments-per-call', type=int, default=None, help='Send this many comments in each LLM request; the system prompt is then paid once per request (default: comments_per_call in the config, else 1)')
+    parser.add_argument('--no-llm-cache', action='store_true', help='Call the LLM for every comment instead of reusing identical requests from .llm_cache.sqlite')
     parser.add_argument('--use-gemini', action='store_true', help='Use a vision LLM (OpenAI) for attachment image OCR (requires OPENAI_API_KEY)')
     parser.add_argument('--no-verify', action='store_true', help='Skip the second-pass stance/entity verification step')
     parser.add_argument('--reprocess', action='store_true', help='Reprocess all comments even if output file exists (default: incremental)')
     parser.add_argument('--force', action='store_true', help='Bypass the safety guard that refuses to overwrite a large parquet with far fewer rows')
 
     args = parser.parse_args()
+    setup_logging()
 
     # Resolve the regulation working directory. All config/data/output paths are
     # relative to it, so we chdir in and let the bare-relative reads/writes land there.
@@ -1401,7 +1594,9 @@ def main():
         
         # Step 1: Read comments from CSV with attachments (sampling applied inside)
         logger.info("=== STEP 1: Loading Comments ===")
-        comments = read_comments_from_csv(args.csv, sample_size=args.sample, use_gemini=args.use_gemini)
+        comments = read_comments_from_csv(args.csv, sample_size=args.sample, use_gemini=args.use_gemini,
+                                          download_workers=args.download_workers,
+                                          extract_workers=args.extract_workers)
         
         # Step 2: Create deduplication table
         logger.info("=== STEP 2: Creating Deduplication Table ===")
@@ -1410,6 +1605,23 @@ def main():
         # Step 3: Analyze only unique comments (incremental if output exists)
         logger.info("=== STEP 3: Analyzing Unique Comments ===")
 
+        # Identical requests from earlier runs are answered from disk. Lives in the
+        # regulation dir next to the checkpoint; delete it to force fresh calls.
+        llm_cache = None if args.no_llm_cache else ResponseCache()
+        comments_per_call = args.comments_per_call or (load_yaml_config() or {}).get('comments_per_call', 1)
+        if comments_per_call > 1:
+            logger.info(f"Packing {comments_per_call} comments per LLM call")
+
+        # The analysis mode the flags pick, for the incremental and full paths alike.
+        def run_analysis(to_analyze):
+            if args.batch_api:
+                return analyze_comments_batch_api(to_analyze, args.model, args.truncate, cache=llm_cache,
+                                                  max_workers=args.workers, batch_size=args.batch_size,
+                                                  output_file=args.output, comments_per_call=comments_per_call)
+            if args.no_parallel:
+                return analyze_comments(to_analyze, args.model, args.truncate, parallel=False, cache=llm_cache, comments_per_call=comments_per_call)
+            return analyze_comments_parallel(to_analyze, args.model, args.truncate, args.workers, args.batch_size, output_file=args.output, cache=llm_cache, comments_per_call=comments_per_call)
+
         # Load previous results for incremental mode
         previous_results = {}
         # Kept for the quality gate below: which comments the corpus already had,
@@ -1440,7 +1652,7 @@ def main():
                         # key out so the comment is retried on the next run.
                         unanalyzed += 1
                         continue
-                    text_key = (row.get('text', '') or '').strip().lower()
+                    text_key = _dedup_key(row.get('text', '') or '')
                     bucket = _stance_bucket(row.get('analysis'))
                     if text_key in cache_bucket and cache_bucket[text_key] != bucket:
                         ambiguous_keys.add(text_key)
@@ -1465,7 +1677,7 @@ def main():
             new_comments = []
             reused_comments = []
             for comment in unique_comments:
-                text_key = comment['text'].strip().lower()
+                text_key = _dedup_key(comment['text'])
                 if text_key in previous_results:
                     prev = previous_results[text_key]
                     comment['analysis'] = prev.get('analysis')
@@ -1476,20 +1688,12 @@ def main():
             logger.info(f"Reusing {len(reused_comments)} previously analyzed comments")
             logger.info(f"Analyzing {len(new_comments)} new comments")
 
-            if new_comments:
-                if args.no_parallel:
-                    new_analyzed = analyze_comments(new_comments, args.model, args.truncate, parallel=False)
-                else:
-                    new_analyzed = analyze_comments_parallel(new_comments, args.model, args.truncate, args.workers, args.batch_size, output_file=args.output)
-            else:
-                new_analyzed = []
-
+            new_analyzed = run_analysis(new_comments) if new_comments else []
             unique_analyzed_comments = reused_comments + new_analyzed
         else:
-            if args.no_parallel:
-                unique_analyzed_comments = analyze_comments(unique_comments, args.model, args.truncate, parallel=False)
-            else:
-                unique_analyzed_comments = analyze_comments_parallel(unique_comments, args.model, args.truncate, args.workers, args.batch_size, output_file=args.output)
+            unique_analyzed_comments = run_analysis(unique_comments)
+        if llm_cache is not None and llm_cache.hits + llm_cache.misses:
+            logger.info(f"LLM response cache: {llm_cache.hits:,} hit(s), {llm_cache.misses:,} miss(es)")
 
         # Step 4: Merge analysis results back to full dataset
         logger.info("=== STEP 4: Merging Results ===")
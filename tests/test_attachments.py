@@ -12,10 +12,16 @@ import pytest
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
+import attachment_utils  # noqa: E402
 from attachment_utils import (  # noqa: E402
     _attachment_stem,
+    extract_text_batch,
+    extract_text_from_file,
+    fetch_and_extract_attachments,
     group_attachments,
     is_gibberish,
+    prefetch_attachments,
+    process_attachments,
 )
 
 
@@ -111,3 +117,199 @@ def test_digits_only_is_gibberish():
 def test_language_agnostic(text):
     """The check judges character classes, so it must not be English-only."""
     assert is_gibberish(text) is False
+
+
+# --- prefetch -------------------------------------------------------------
+
+def _capture_targets(monkeypatch):
+    seen = []
+
+    async def fake_download_many(targets, concurrency):
+        seen.extend(targets)
+        return [True] * len(targets)
+
+    monkeypatch.setattr(attachment_utils, '_download_many', fake_download_many)
+    return seen
+
+
+def test_prefetch_fetches_only_the_preferred_format(tmp_path, monkeypatch):
+    """The PDF rendition of a .docx upload is usually never read; don't fetch it."""
+    seen = _capture_targets(monkeypatch)
+    row = {'Document ID': 'DOC-1',
+           'Attachment Files': 'https://x/Letter.pdf,https://x/Letter.docx'}
+    assert prefetch_attachments([row], str(tmp_path)) == 1
+    assert [os.path.basename(p) for _, p in seen] == ['attachment_2_Letter.docx']
+
+
+def test_prefetch_skips_what_is_already_on_disk(tmp_path, monkeypatch):
+    seen = _capture_targets(monkeypatch)
+    comment_dir = tmp_path / 'DOC-1'
+    comment_dir.mkdir()
+    (comment_dir / 'attachment_1_A.pdf').write_bytes(b'%PDF')
+    (comment_dir / 'attachment_2_B.pdf.extracted.txt').write_text('cached letter')
+    row = {'Document ID': 'DOC-1',
+           'Attachment Files': 'https://x/A.pdf,https://x/B.pdf,https://x/C.pdf'}
+    prefetch_attachments([row], str(tmp_path))
+    assert [os.path.basename(p) for _, p in seen] == ['attachment_3_C.pdf']
+
+
+# --- batch extraction -----------------------------------------------------
+
+def _write_pdf(path, text):
+    import fitz
+    with fitz.open() as doc:
+        doc.new_page().insert_text((72, 72), text)
+        doc.save(str(path))
+
+
+def test_batch_extraction_returns_each_files_own_text(tmp_path):
+    """PDFs go through worker processes; results must still land on the right path."""
+    paths = []
+    for i in range(3):
+        p = tmp_path / f'letter{i}.pdf'
+        _write_pdf(p, f'Letter number {i} opposing the proposed rule in full.')
+        paths.append(str(p))
+    note = tmp_path / 'note.txt'
+    note.write_text('A short plain-text note about the proposed rule.')
+    paths.append(str(note))
+
+    out = extract_text_batch(paths, max_workers=2)
+    assert set(out) == set(paths)
+    for i in range(3):
+        assert f'Letter number {i}' in out[paths[i]]
+    assert 'plain-text note' in out[str(note)]
+
+
+def test_long_pdf_split_across_processes_keeps_page_order(tmp_path):
+    """Page ranges come back from different workers; the text must not reorder."""
+    import fitz
+    path = tmp_path / 'filing.pdf'
+    with fitz.open() as doc:
+        for i in range(attachment_utils._PAGE_PARALLEL_MIN_PAGES + 6):
+            doc.new_page().insert_text((72, 72), f'Page marker {i:03d} of the filing.')
+        doc.save(str(path))
+
+    text = extract_text_from_file(str(path))
+    positions = [text.index(f'Page marker {i:03d}')
+                 for i in range(attachment_utils._PAGE_PARALLEL_MIN_PAGES + 6)]
+    assert positions == sorted(positions)
+
+
+def test_same_file_under_two_comments_is_extracted_once(tmp_path, monkeypatch):
+    """A campaign letter attached to many comments should be read a single time."""
+    import shutil
+    for doc_id in ('DOC-1', 'DOC-2'):
+        os.makedirs(tmp_path / doc_id)
+    _write_pdf(tmp_path / 'DOC-1' / 'attachment_1_letter.pdf',
+               'Identical campaign letter opposing the proposed rule.')
+    shutil.copy(tmp_path / 'DOC-1' / 'attachment_1_letter.pdf',
+                tmp_path / 'DOC-2' / 'attachment_1_letter.pdf')
+
+    calls = []
+    real_extract = attachment_utils.extract_text_from_file
+    monkeypatch.setattr(attachment_utils, 'extract_text_from_file',
+                        lambda path, **kw: calls.append(path) or real_extract(path, **kw))
+
+    texts = [process_attachments({'Document ID': doc_id,
+                                  'Attachment Files': 'https://example.gov/letter.pdf'},
+                                 str(tmp_path), download_missing=False)[0]
+             for doc_id in ('DOC-1', 'DOC-2')]
+
+    assert len(calls) == 1
+    assert texts[0] == texts[1] and 'campaign letter' in texts[0]
+
+
+def test_reextraction_refreshes_the_shared_content_cache(tmp_path, monkeypatch):
+    """Corrected text must reach other comments carrying the same file, not just this one."""
+    import shutil
+    for doc_id in ('DOC-1', 'DOC-2'):
+        os.makedirs(tmp_path / doc_id)
+    _write_pdf(tmp_path / 'DOC-1' / 'attachment_1_letter.pdf',
+               'Identical campaign letter opposing the proposed rule.')
+    shutil.copy(tmp_path / 'DOC-1' / 'attachment_1_letter.pdf',
+                tmp_path / 'DOC-2' / 'attachment_1_letter.pdf')
+
+    def process(doc_id):
+        return process_attachments({'Document ID': doc_id,
+                                    'Attachment Files': 'https://example.gov/letter.pdf'},
+                                   str(tmp_path), download_missing=False)[0]
+
+    process('DOC-1')
+    monkeypatch.setattr(attachment_utils, 'extract_text_from_file',
+                        lambda path, **kw: 'Corrected extraction of the campaign letter.')
+    attachment_utils.reextract_attachment_text('DOC-1', str(tmp_path))
+
+    assert 'Corrected extraction' in process('DOC-2')
+
+
+def test_interrupted_download_leaves_nothing_at_the_path(tmp_path, monkeypatch):
+    """Later runs take an existing file as a finished download, so a partial one must not land."""
+    class Body:
+        decode_content = False
+        sent = False
+
+        def read(self, n):
+            if self.sent:
+                raise ConnectionError('connection reset')
+            self.sent = True
+            return b'%PDF-1.7 first half'
+
+    class CutOff:
+        raw = Body()
+
+        def raise_for_status(self):
+            pass
+
+    monkeypatch.setattr(attachment_utils._SESSION, 'get', lambda *a, **kw: CutOff())
+    path = tmp_path / 'DOC-1' / 'attachment_1_letter.pdf'
+
+    assert attachment_utils.download_attachment('https://example.gov/letter.pdf', str(path)) is False
+    assert os.listdir(tmp_path / 'DOC-1') == []
+
+
+def test_html_attachment_text_excludes_scripts_and_styles(tmp_path):
+    path = tmp_path / 'attachment_1_letter.html'
+    path.write_bytes(
+        '<html><head><style>p { color: red; }</style><script>var tracking = 1;</script></head>'
+        '<body><p>I write to oppose the proposed rule on behalf of my family.</p>'
+        '<p>It would harm research in our state — please withdraw it.</p></body></html>'.encode('utf-8'))
+
+    text = extract_text_from_file(str(path))
+    assert 'oppose the proposed rule' in text and 'state — please withdraw' in text
+    assert 'tracking' not in text and 'color' not in text
+
+
+def test_fetch_and_extract_covers_downloaded_and_existing_files(tmp_path, monkeypatch):
+    """Files already on disk and files that arrive mid-run both come back extracted."""
+    os.makedirs(tmp_path / 'DOC-1')
+    _write_pdf(tmp_path / 'DOC-1' / 'attachment_1_old.pdf', 'Letter that was downloaded on an earlier run.')
+
+    async def fake_download(session, sem, url, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_pdf(path, 'Letter that arrives during this run.')
+        return True
+
+    monkeypatch.setattr(attachment_utils, '_download_attachment_async', fake_download)
+    rows = [{'Document ID': 'DOC-1', 'Attachment Files': 'https://example.gov/old.pdf'},
+            {'Document ID': 'DOC-2', 'Attachment Files': 'https://example.gov/new.pdf'}]
+
+    texts = fetch_and_extract_attachments(rows, str(tmp_path), max_workers=2)
+
+    assert 'earlier run' in texts[str(tmp_path / 'DOC-1' / 'attachment_1_old.pdf')]
+    assert 'during this run' in texts[str(tmp_path / 'DOC-2' / 'attachment_1_new.pdf')]
+
+
+def test_fetch_and_extract_hashes_files_off_the_event_loop(tmp_path, monkeypatch):
+    """Hashing a large file on the loop would stall every download in flight."""
+    import threading
+    os.makedirs(tmp_path / 'DOC-1')
+    _write_pdf(tmp_path / 'DOC-1' / 'attachment_1_old.pdf', 'Letter that was downloaded on an earlier run.')
+    hashed_on = []
+    real_fingerprint = attachment_utils._content_fingerprint
+    monkeypatch.setattr(attachment_utils, '_content_fingerprint',
+                        lambda path: hashed_on.append(threading.current_thread()) or real_fingerprint(path))
+
+    fetch_and_extract_attachments([{'Document ID': 'DOC-1', 'Attachment Files': 'https://example.gov/old.pdf'}],
+                                  str(tmp_path), max_workers=1)
+
+    assert hashed_on and threading.main_thread() not in hashed_on
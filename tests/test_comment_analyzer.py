@@ -0,0 +1,552 @@
+"""Tests for how CommentAnalyzer talks to the LLM.
+
+No network: `litellm.completion` is replaced with a stub that records what it
+was sent and answers with a fixed analysis, so these pin the request handling
+around the call — not what any model would say.
+"""
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import comment_analyzer  # noqa: E402
+from comment_analyzer import CommentAnalyzer  # noqa: E402
+from llm_cache import ResponseCache  # noqa: E402
+
+CONFIG = os.path.join(os.path.dirname(__file__), '..', 'regulations',
+                      'omb-financial-assistance', 'analyzer_config.yaml')
+OPPOSE = 'Position: Oppose the proposed rule'
+
+
+def _answer(stances):
+    return {'stances': stances, 'entity_type': 'Individual/Other',
+            'key_quote': 'I oppose this rule.', 'rationale': 'Says so directly.'}
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Every request the analyzer sends; each is answered with an oppose analysis."""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    sent = []
+
+    def fake_completion(**kwargs):
+        sent.append(kwargs)
+        content = json.dumps(_answer([OPPOSE]))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    monkeypatch.setattr(comment_analyzer.litellm, 'completion', fake_completion)
+    return sent
+
+
+def test_identical_request_is_answered_from_the_cache(tmp_path, calls):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'))
+    analyzer = CommentAnalyzer(config_file=CONFIG, cache=cache)
+
+    first = analyzer.analyze('I oppose this rule.', comment_id='C-1')
+    second = analyzer.analyze('I oppose this rule.', comment_id='C-1')
+
+    assert len(calls) == 1
+    assert first == second and first['stances'] == [OPPOSE]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_a_different_model_is_a_different_request(tmp_path, calls):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'))
+    CommentAnalyzer(model='gpt-5.4-nano', config_file=CONFIG, cache=cache).analyze('I oppose this rule.')
+    CommentAnalyzer(model='gpt-5.4-mini', config_file=CONFIG, cache=cache).analyze('I oppose this rule.')
+
+    assert len(calls) == 2
+
+
+def test_a_different_schema_is_a_different_request(tmp_path, calls):
+    """A new enum option changes what the model may answer, even with the same messages."""
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'))
+    first = CommentAnalyzer(config_file=CONFIG, cache=cache)
+    second = CommentAnalyzer(config_file=CONFIG, cache=cache)
+    second.response_format = {**first.response_format, 'json_schema': {'name': 'changed'}}
+
+    first.analyze('I oppose this rule.')
+    second.analyze('I oppose this rule.')
+    assert len(calls) == 2
+
+
+def test_cache_survives_reopening(tmp_path, calls):
+    """The point is reuse across runs, so a new process must see old answers."""
+    path = str(tmp_path / 'cache.sqlite')
+    cache = ResponseCache(path)
+    CommentAnalyzer(config_file=CONFIG, cache=cache).analyze('I oppose this rule.')
+    cache.close()
+
+    CommentAnalyzer(config_file=CONFIG, cache=ResponseCache(path)).analyze('I oppose this rule.')
+    assert len(calls) == 1
+
+
+def test_a_new_representative_id_still_hits_the_cache(tmp_path, calls):
+    """Dedup may pick another copy as representative next run; the text is what matters."""
+    path = str(tmp_path / 'cache.sqlite')
+    cache = ResponseCache(path)
+    CommentAnalyzer(config_file=CONFIG, cache=cache).analyze('I oppose this rule.', comment_id='C-1')
+    cache.close()
+
+    CommentAnalyzer(config_file=CONFIG, cache=ResponseCache(path)).analyze('I oppose this rule.', comment_id='C-7')
+    assert len(calls) == 1
+    assert '(ID: C-1)' in calls[0]['messages'][1]['content']
+
+
+def test_output_cap_comes_from_the_config_and_client_retries_are_off(monkeypatch, calls):
+    import yaml
+    with open(CONFIG, encoding='utf-8') as f:
+        raw = yaml.safe_load(f)
+
+    CommentAnalyzer(config_file=CONFIG).analyze('I oppose this rule.')
+    CommentAnalyzer(config_file=CONFIG, config={**raw, 'max_output_tokens': 4000}).analyze('I oppose this rule.')
+
+    assert 'max_tokens' not in calls[0] and calls[1]['max_tokens'] == 4000
+    assert all(call['max_retries'] == 0 for call in calls)
+
+
+def test_deployments_route_calls_through_a_router(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    answer = json.dumps(_answer([OPPOSE]))
+    deployments = [{'model_name': 'analysis',
+                    'litellm_params': {'model': f'openai/deployment-{n}', 'api_key': 'test-key',
+                                       'mock_response': answer}}
+                   for n in (1, 2)]
+
+    analyzer = CommentAnalyzer(model='analysis', config_file=CONFIG, deployments=deployments)
+    assert analyzer.analyze('I oppose this rule.')['stances'] == [OPPOSE]
+
+    with pytest.raises(ValueError, match='not among the configured deployments'):
+        CommentAnalyzer(model='gpt-5.4-nano', config_file=CONFIG, deployments=deployments)
+
+
+def test_stances_are_matched_loosely_and_written_canonically(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    analyzer = CommentAnalyzer(config_file=CONFIG)
+    result = analyzer._check_result(_answer([f' {OPPOSE.upper()} ', OPPOSE, 'Position: Invented', 7]))
+
+    assert result['stances'] == [OPPOSE]
+
+
+def test_only_transient_failures_are_retried(monkeypatch):
+    """A busy provider is worth another try; an answer that fails validation is not."""
+    from tenacity import wait_none
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setattr(comment_analyzer, '_RETRY_WAIT', wait_none())
+    monkeypatch.setattr(comment_analyzer, '_RATE_LIMIT_WAIT', wait_none())
+    litellm = comment_analyzer.litellm
+    replies = []
+
+    def flaky(**kwargs):
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+
+    monkeypatch.setattr(litellm, 'completion', flaky)
+    analyzer = CommentAnalyzer(config_file=CONFIG)
+
+    replies[:] = [litellm.RateLimitError('slow down', llm_provider='openai', model='m'),
+                  json.dumps(_answer([OPPOSE]))]
+    assert analyzer.analyze('I oppose this rule.')['stances'] == [OPPOSE]
+    assert replies == []
+
+    replies[:] = [json.dumps({'stances': []}), json.dumps(_answer([OPPOSE]))]
+    with pytest.raises(ValueError, match='Missing required field'):
+        analyzer.analyze('I oppose this rule.')
+    assert len(replies) == 1
+
+
+def test_backoff_honours_retry_after():
+    import httpx
+    from tenacity import RetryCallState
+    litellm = comment_analyzer.litellm
+
+    def wait_after(error):
+        state = RetryCallState(retry_object=None, fn=None, args=(), kwargs={})
+        state.set_exception((type(error), error, None))
+        return comment_analyzer._backoff(state)
+
+    told = litellm.RateLimitError('slow down', llm_provider='openai', model='m', response=httpx.Response(
+        429, headers={'retry-after': '7'}, request=httpx.Request('POST', 'https://example.test')))
+    assert 7 <= wait_after(told) < 8
+    assert wait_after(TimeoutError()) <= 30
+
+
+def test_a_form_letter_campaign_is_one_call(tmp_path, calls):
+    """Identical letters under different Document IDs share one cached answer."""
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'))
+    analyzer = CommentAnalyzer(config_file=CONFIG, cache=cache)
+    results = [analyzer.analyze('I oppose this rule.', comment_id=f'C-{n}') for n in range(5)]
+
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (4, 1)
+    assert all(r['stances'] == [OPPOSE] for r in results)
+
+
+def test_memory_tier_is_bounded_and_falls_back_to_disk(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), memory_entries=1)
+    cache.set('a', '"first"')
+    cache.set('b', '"second"')
+
+    assert list(cache._memory) == ['b']
+    assert cache.get('a') == '"first"'
+    assert list(cache._memory) == ['a']
+
+
+def test_concurrent_analysis_returns_results_in_input_order(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+
+    async def fake_acompletion(**kwargs):
+        text = kwargs['messages'][1]['content']
+        # Later comments answer first, so order has to be restored, not assumed.
+        await asyncio.sleep(0.01 if 'first' in text else 0)
+        stances = [OPPOSE] if 'first' in text else []
+        content = json.dumps(_answer(stances))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    monkeypatch.setattr(comment_analyzer.litellm, 'acompletion', fake_acompletion)
+    analyzer = CommentAnalyzer(config_file=CONFIG)
+    results = analyzer.analyze_many(
+        [{'comment_text': 'the first comment'}, {'comment_text': 'the second comment'}])
+
+    assert [r['stances'] for r in results] == [[OPPOSE], []]
+
+
+def test_packed_call_demultiplexes_by_comment_id(monkeypatch):
+    """Answers come back keyed by id; one the model dropped must be None, not a neighbour's."""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    sent = []
+
+    def fake_completion(**kwargs):
+        sent.append(kwargs)
+        content = json.dumps({'results': [
+            {'comment_id': '3', 'analysis': _answer([])},
+            {'comment_id': '1', 'analysis': _answer([OPPOSE])},
+        ]})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    monkeypatch.setattr(comment_analyzer.litellm, 'completion', fake_completion)
+    analyzer = CommentAnalyzer(config_file=CONFIG)
+    results = analyzer.analyze_batch([{'comment_text': f'comment {i}'} for i in range(3)], batch_size=3)
+
+    assert len(sent) == 1
+    assert results[0]['stances'] == [OPPOSE]
+    assert results[1] is None
+    assert results[2]['stances'] == []
+
+
+def test_config_is_parsed_once_and_never_mutated(monkeypatch):
+    """Analyzers share the loaded config, so one must not edit what the next one reads."""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    first = CommentAnalyzer(config_file=CONFIG)
+    second = CommentAnalyzer(config_file=CONFIG)
+
+    assert first.config is second.config
+    first.entity_types.append('Something Else')
+    assert 'Something Else' not in second.config['entity_types']
+
+
+def test_analyzers_for_one_config_share_one_schema(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    first = CommentAnalyzer(config_file=CONFIG)
+    second = CommentAnalyzer(model='gpt-5.4-mini', config_file=CONFIG)
+    assert first.result_model is second.result_model
+    assert first.response_format is second.response_format
+
+
+def test_a_tokenizer_failure_does_not_stop_construction(monkeypatch):
+    """The request-size log line is informational only."""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    counted = []
+
+    def broken_counter(**kwargs):
+        counted.append(kwargs['model'])
+        raise ValueError('no tokenizer for this model')
+
+    monkeypatch.setattr(comment_analyzer.litellm, 'token_counter', broken_counter)
+    monkeypatch.setattr(comment_analyzer, '_OVERHEAD_LOGGED', set())
+    CommentAnalyzer(model='routed-group', config_file=CONFIG)
+    CommentAnalyzer(model='routed-group', config_file=CONFIG)
+    assert counted == ['routed-group']
+
+
+def test_a_parsed_config_can_be_passed_directly(monkeypatch):
+    import yaml
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    with open(CONFIG, encoding='utf-8') as f:
+        raw = yaml.safe_load(f)
+
+    analyzer = CommentAnalyzer(config_file='does-not-exist.yaml', config=raw)
+    assert analyzer.get_system_prompt() == CommentAnalyzer(config_file=CONFIG).get_system_prompt()
+
+
+def test_a_litellm_timeout_surfaces_as_timeout_error(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+
+    def slow(**kwargs):
+        raise comment_analyzer.litellm.Timeout('took too long', model=kwargs['model'], llm_provider='openai')
+
+    monkeypatch.setattr(comment_analyzer.litellm, 'completion', slow)
+    with pytest.raises(comment_analyzer.TimeoutError):
+        CommentAnalyzer(config_file=CONFIG).analyze_with_timeout('I oppose this rule.')
+
+
+def test_a_refusal_surfaces_as_value_error(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+
+    def refuse(**kwargs):
+        message = SimpleNamespace(content=None, refusal="I can't help with that.")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    monkeypatch.setattr(comment_analyzer.litellm, 'completion', refuse)
+    with pytest.raises(ValueError, match="refused: I can't help"):
+        CommentAnalyzer(config_file=CONFIG).analyze_with_timeout('I oppose this rule.')
+
+
+def test_batch_api_results_map_back_by_position(tmp_path, monkeypatch):
+    """Output lines arrive in any order and may be missing; cached comments aren't resubmitted."""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    litellm = comment_analyzer.litellm
+    uploaded = []
+
+    def create_file(file, purpose, custom_llm_provider):
+        uploaded.extend(json.loads(line) for line in file[1].decode('utf-8').splitlines())
+        return SimpleNamespace(id='file-in')
+
+    def output_line(custom_id, stances):
+        body = {'choices': [{'message': {'content': json.dumps(_answer(stances))}}]}
+        return json.dumps({'custom_id': custom_id, 'response': {'status_code': 200, 'body': body}})
+
+    output = '\n'.join([output_line('2', []), output_line('1', [OPPOSE])])
+    monkeypatch.setattr(litellm, 'create_file', create_file)
+    monkeypatch.setattr(litellm, 'create_batch',
+                        lambda **kw: SimpleNamespace(id='batch-1', status='validating', output_file_id=None))
+    monkeypatch.setattr(litellm, 'retrieve_batch',
+                        lambda **kw: SimpleNamespace(id='batch-1', status='completed', output_file_id='file-out'))
+    monkeypatch.setattr(litellm, 'file_content', lambda **kw: SimpleNamespace(text=output))
+    monkeypatch.setattr(comment_analyzer.time, 'sleep', lambda seconds: None)
+
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'))
+    analyzer = CommentAnalyzer(config_file=CONFIG, cache=cache)
+    items = [{'comment_text': f'comment {i}'} for i in range(4)]
+    cache.set(analyzer._cache_key(**items[0]), json.dumps(_answer([OPPOSE])))
+
+    results = analyzer.analyze_via_batch_api(items)
+
+    assert [line['custom_id'] for line in uploaded] == ['1', '2', '3']
+    assert results[0]['stances'] == [OPPOSE] and results[1]['stances'] == [OPPOSE]
+    assert results[2]['stances'] == [] and results[3] is None
+    assert analyzer._cached_result(analyzer._cache_key(**items[1])) is not None
+
+
+def test_batch_api_splits_a_docket_over_the_batch_limit(tmp_path, monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setattr(comment_analyzer, 'BATCH_MAX_REQUESTS', 2)
+    monkeypatch.setattr(comment_analyzer.time, 'sleep', lambda seconds: None)
+    litellm = comment_analyzer.litellm
+    files = {}
+
+    def create_file(file, purpose, custom_llm_provider):
+        file_id = f'file-{len(files)}'
+        files[file_id] = [json.loads(line) for line in file[1].decode('utf-8').splitlines()]
+        return SimpleNamespace(id=file_id)
+
+    def file_content(file_id, custom_llm_provider):
+        body = {'choices': [{'message': {'content': json.dumps(_answer([OPPOSE]))}}]}
+        return SimpleNamespace(text='\n'.join(
+            json.dumps({'custom_id': line['custom_id'], 'response': {'status_code': 200, 'body': body}})
+            for line in files[file_id]))
+
+    monkeypatch.setattr(litellm, 'create_file', create_file)
+    monkeypatch.setattr(litellm, 'create_batch', lambda input_file_id, **kw: SimpleNamespace(
+        id=input_file_id, status='completed', output_file_id=input_file_id))
+    monkeypatch.setattr(litellm, 'file_content', file_content)
+
+    analyzer = CommentAnalyzer(config_file=CONFIG)
+    results = analyzer.analyze_via_batch_api([{'comment_text': f'comment {i}'} for i in range(5)])
+
+    assert [[line['custom_id'] for line in lines] for lines in files.values()] == [
+        ['0', '1'], ['2', '3'], ['4']]
+    assert all(r['stances'] == [OPPOSE] for r in results)
+
+
+@pytest.mark.parametrize('model, marked', [('gpt-5.4-nano', False),
+                                           ('anthropic/claude-sonnet-4-5', True)])
+def test_system_prompt_is_marked_cacheable_only_where_needed(monkeypatch, model, marked):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    analyzer = CommentAnalyzer(model=model, config_file=CONFIG)
+    system = analyzer._build_messages('I oppose this rule.')[0]
+
+    if marked:
+        assert system['content'][0]['cache_control'] == {'type': 'ephemeral'}
+        assert system['content'][0]['text'] == analyzer.get_system_prompt()
+    else:
+        assert system['content'] == analyzer.get_system_prompt()
+
+
+def test_pipeline_pack_sends_unanswered_comments_on_their_own():
+    from pipeline import analyze_comment_pack
+
+    class StubAnalyzer:
+        model = 'stub-model'
+        cache = None
+
+        def __init__(self):
+            self.single_calls = []
+
+        def analyze_batch(self, items, batch_size):
+            return [_answer([OPPOSE]), None]
+
+        def analyze(self, text, comment_id=None, organization=None, submitter=None):
+            self.single_calls.append(comment_id)
+            return _answer([])
+
+    analyzer = StubAnalyzer()
+    comments = [{'id': 'C-1', 'text': 'I oppose this rule.'},
+                {'id': 'C-2', 'text': 'Something the packed call skipped.'}]
+    results = analyze_comment_pack(analyzer, comments)
+
+    assert analyzer.single_calls == ['C-2']
+    assert [r['id'] for r in results] == ['C-1', 'C-2']
+    assert results[0]['analysis']['stances'] == [OPPOSE]
+
+
+def test_short_comments_are_routed_to_the_configured_model(tmp_path, monkeypatch):
+    import yaml
+    from pipeline import _analysis_jobs, build_analyzer_route
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    with open(CONFIG, encoding='utf-8') as f:
+        raw = yaml.safe_load(f)
+    raw['short_comments'] = {'model': 'gpt-5.4-nano', 'max_chars': 20}
+    (tmp_path / 'analyzer_config.yaml').write_text(yaml.safe_dump(raw), encoding='utf-8')
+    monkeypatch.chdir(tmp_path)
+
+    route = build_analyzer_route('gpt-5.4-mini')
+    comments = [{'id': 'C-1', 'text': 'I oppose this.'},
+                {'id': 'C-2', 'text': 'A much longer comment about the rule.'},
+                {'id': 'C-3', 'text': 'Me too.'}]
+    jobs = _analysis_jobs(comments, route, comments_per_call=5)
+
+    assert {(a.model, frozenset(c['id'] for c in pack)) for a, pack in jobs} == {
+        ('gpt-5.4-nano', frozenset({'C-1', 'C-3'})), ('gpt-5.4-mini', frozenset({'C-2'}))}
+
+
+def test_config_deployments_leave_fallback_and_short_models_direct(tmp_path, monkeypatch):
+    """Deployments name the primary model; other analyzers from the config must still work."""
+    import yaml
+    import pipeline
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    with open(CONFIG, encoding='utf-8') as f:
+        raw = yaml.safe_load(f)
+    raw['short_comments'] = {'model': 'gpt-5.4-nano', 'max_chars': 20}
+    raw['deployments'] = [{'model_name': 'analysis',
+                           'litellm_params': {'model': 'openai/deployment-1', 'api_key': 'test-key'}}]
+    (tmp_path / 'analyzer_config.yaml').write_text(yaml.safe_dump(raw), encoding='utf-8')
+    monkeypatch.chdir(tmp_path)
+    direct = []
+
+    def fake_completion(**kwargs):
+        direct.append(kwargs['model'])
+        content = json.dumps(_answer([OPPOSE]))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    monkeypatch.setattr(comment_analyzer.litellm, 'completion', fake_completion)
+    monkeypatch.setattr(pipeline, 'validate_analysis', lambda analysis, *a, **kw: analysis)
+
+    route = pipeline.build_analyzer_route('analysis')
+    assert route('Me too.').router is None and route('Me too.').model == 'gpt-5.4-nano'
+    primary = route('A much longer comment about the rule.')
+    assert primary.router is not None
+
+    def bad_deployment(**kwargs):
+        raise ValueError('deployment returned nonsense')
+
+    monkeypatch.setattr(primary.router, 'completion', bad_deployment)
+    result = pipeline.analyze_single_comment(primary, {'id': 'C-1', 'text': 'A much longer comment.'})
+    assert result['model_used'] == pipeline.FALLBACK_MODEL
+    assert result['analysis']['stances'] == [OPPOSE]
+    assert direct == [pipeline.FALLBACK_MODEL]
+
+
+def test_pipeline_batch_api_sends_unanswered_comments_live(monkeypatch):
+    import pipeline
+
+    class StubAnalyzer:
+        model = 'stub-model'
+
+        def __init__(self, **kwargs):
+            pass
+
+        def analyze_via_batch_api(self, items):
+            return [None, _answer([OPPOSE])]
+
+    live = []
+
+    def fake_parallel(comments, model, truncate_chars=None, cache=None, **kwargs):
+        live.extend(c['id'] for c in comments)
+        return [{**c, 'analysis': _answer([]), 'model_used': model} for c in comments]
+
+    monkeypatch.setattr(pipeline, 'CommentAnalyzer', StubAnalyzer)
+    monkeypatch.setattr(pipeline, 'analyze_comments_parallel', fake_parallel)
+    comments = [{'id': 'C-1', 'text': 'Something the batch skipped.'},
+                {'id': 'C-2', 'text': 'I oppose this rule.'}]
+    results = pipeline.analyze_comments_batch_api(comments, 'stub-model')
+
+    assert live == ['C-1']
+    assert [r['id'] for r in results] == ['C-1', 'C-2']
+    assert results[1]['analysis']['stances'] == [OPPOSE]
+
+
+def test_long_comments_keep_their_opening_and_conclusion():
+    from pipeline import TRUNCATION_MARKER, _analysis_text
+    text = 'I oppose this rule. ' + 'x' * 1000 + ' Please withdraw it.'
+
+    cut = _analysis_text({'text': text}, truncate_chars=40)
+
+    assert cut.startswith('I oppose this rule.') and cut.endswith('Please withdraw it.')
+    assert TRUNCATION_MARKER in cut
+    assert _analysis_text({'text': 'Short.'}, truncate_chars=40) == 'Short.'
+
+
+def test_copies_differing_only_in_whitespace_are_analyzed_once():
+    from pipeline import create_dedup_table, merge_analysis_results
+    comments = [{'id': 'C-1', 'text': 'I oppose this rule.\r\nPlease withdraw it.'},
+                {'id': 'C-2', 'text': 'I  oppose this rule. Please withdraw it. '},
+                {'id': 'C-3', 'text': 'I support this rule.'}]
+
+    unique, mapping = create_dedup_table(comments)
+    assert [c['duplicate_ids'] for c in unique] == [['C-1', 'C-2'], ['C-3']]
+
+    merged = merge_analysis_results([{**c, 'analysis': _answer([])} for c in unique], mapping)
+    assert sorted(c['id'] for c in merged) == ['C-1', 'C-2', 'C-3']
+
+
+def test_checkpoint_resume_matches_whitespace_variants(tmp_path, monkeypatch):
+    """A group resumes from the checkpoint whichever variant represents it this run."""
+    import pipeline
+    monkeypatch.chdir(tmp_path)
+    with open(pipeline.CHECKPOINT_FILE, 'w') as f:
+        f.write(pipeline._checkpoint_line({'id': 'C-1', 'text': 'I oppose this rule.\r\nPlease withdraw it.',
+                                           'analysis': _answer([OPPOSE])}) + '\n')
+        f.write(json.dumps({'text_key': 'i  oppose   that rule.', 'id': 'C-9', 'analysis': _answer([])}) + '\n')
+
+    checkpoint = pipeline._load_checkpoint()
+    assert pipeline._checkpoint_key({'text': 'I  oppose this rule. Please withdraw it. '}) in checkpoint
+    assert 'i oppose that rule.' in checkpoint  # written before keys collapsed whitespace
+
+
+def test_packs_group_similar_lengths_within_a_character_budget():
+    from pipeline import _analysis_jobs
+    analyzer = object()
+    lengths = {'long': 900, 'a': 10, 'mid': 300, 'b': 20, 'c': 30}
+    comments = [{'id': cid, 'text': 'x' * n} for cid, n in lengths.items()]
+
+    jobs = _analysis_jobs(comments, lambda text: analyzer, comments_per_call=3, pack_chars=1000)
+
+    assert [[c['id'] for c in pack] for _, pack in jobs] == [['a', 'b', 'c'], ['mid'], ['long']]
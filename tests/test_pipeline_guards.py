@@ -108,6 +108,27 @@ def test_ordinary_errors_are_not_credentials_errors(error):
     assert not _is_credentials_error(error)
 
 
+def test_work_done_before_a_credentials_abort_is_checkpointed(tmp_path, monkeypatch):
+    """Each finished comment is on disk before the next one can abort the run."""
+    import pipeline
+    from comment_analyzer import LLMCredentialsError
+
+    def fake_analyze(analyzer, comment, truncate_chars=None):
+        if comment['id'] == 'C-2':
+            raise LLMCredentialsError('insufficient_quota')
+        return {**comment, 'analysis': OPPOSE}
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pipeline, 'CommentAnalyzer', lambda **kwargs: None)
+    monkeypatch.setattr(pipeline, 'analyze_single_comment', fake_analyze)
+    comments = [{'id': 'C-1', 'text': 'First.'}, {'id': 'C-2', 'text': 'Second.'}]
+
+    with pytest.raises(LLMCredentialsError):
+        pipeline.analyze_comments_parallel(comments, max_workers=1)
+
+    assert set(pipeline._load_checkpoint()) == {'first.'}
+
+
 # --- stance shares --------------------------------------------------------
 
 def test_stance_shares_are_percentages():